@@ -0,0 +1,69 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from quickdraw import QuickDrawDataGroup
+from rasterize import rasterize_all
+
+# Drawings/sec for turning QuickDraw drawings into 28x28 images: PIL, one
+# drawing at a time at full size and then downscaled, against rasterize.py in
+# one process and across process pools. Also checks that rasterize.py's
+# images match PIL's where there is ink: most pixels are background, which
+# would hide large differences along the strokes in an all-pixel average.
+#
+#     python bench_rasterize.py --categories cat dog --count 5000 --processes 1 4
+
+IMG_SIZE = (28, 28)
+STROKE_WIDTH = 3
+# Largest acceptable differences from PIL, in gray levels, over the pixels
+# inked in either image: on average, and at the 99th percentile
+INK_TOLERANCE = 4.0
+PERCENTILE_TOLERANCE = 24
+
+# The way images.py used to render drawings
+def rasterize_with_pil(drawings):
+    images = []
+    for drawing in drawings:
+        img = drawing.get_image(stroke_width=STROKE_WIDTH).resize(IMG_SIZE).convert("L")
+        images.append(255 - np.array(img))
+    return np.array(images, dtype=np.uint8)
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rasterizing QuickDraw drawings to 28x28 images")
+    parser.add_argument("--categories", nargs="+", default=["cat", "dog"], help="QuickDraw categories to draw")
+    parser.add_argument("--count", type=int, default=5000, help="drawings per category")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, os.cpu_count()], help="pool sizes to compare")
+    args = parser.parse_args()
+
+    drawings = []
+    for category in args.categories:
+        drawings.extend(QuickDrawDataGroup(category, max_drawings=args.count, recognized=True).drawings)
+    strokes = [drawing.image_data for drawing in drawings]
+    print(f"{len(drawings)} drawings, {os.cpu_count()} CPUs")
+
+    reference, seconds = timed(rasterize_with_pil, drawings)
+    print(f"{'PIL':>16}{len(drawings) / seconds:>12.0f} drawings/sec")
+    for processes in dict.fromkeys(args.processes):
+        images, seconds = timed(rasterize_all, strokes, IMG_SIZE, STROKE_WIDTH, processes=processes)
+        print(f"{f'rasterize x{processes}':>16}{len(drawings) / seconds:>12.0f} drawings/sec")
+
+    difference = np.abs(images.astype(np.int16) - reference)
+    inked = difference[(images > 0) | (reference > 0)]
+    mean = inked.mean() if inked.size else 0.0
+    percentile = np.percentile(inked, 99) if inked.size else 0.0
+    print(f"difference from PIL on inked pixels: mean {mean:.2f}, 99th percentile {percentile:.0f}, "
+          f"max {difference.max()} gray levels (all pixels: mean {difference.mean():.2f}); "
+          f"total ink {images.sum() / max(reference.sum(), 1) - 1:+.1%}")
+    if mean > INK_TOLERANCE or percentile > PERCENTILE_TOLERANCE:
+        print(f"over the tolerance of {INK_TOLERANCE} gray levels on average "
+              f"or {PERCENTILE_TOLERANCE} at the 99th percentile")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -5,46 +5,49 @@ import tensorflow as tf
 from tensorflow.keras import layers, models
 from PIL import Image, ImageDraw
 import os
+import sys
 from quickdraw import QuickDrawDataGroup
-from sklearn.model_selection import train_test_split
+from quickdraw.names import QUICK_DRAWING_NAMES
 import matplotlib.pyplot as plt
 from sklearn.manifold import TSNE
+from shards import cached_images, shard_path
+from rasterize import rasterize_all
+from pipeline import streaming_dataset, test_sample, InputStallTimer
 
 # Selected object categories from Quick, Draw! (10 categories)
 CATEGORIES = ["cat", "dog", "tree", "house", "car", "apple", "chair", "bird", "fish", "flower"]
 NUM_CLASSES = len(CATEGORIES)
 IMG_SIZE = (28, 28)
 IMAGES_PER_CATEGORY = 1000  # Reduced for testing; revert to 10000 if needed
-
-# Load and preprocess Quick, Draw! dataset
-def load_and_preprocess_data():
-    x_data = []
-    y_data = []
-    
-    for idx, category in enumerate(CATEGORIES):
+STROKE_WIDTH = 3
+TSNE_POINTS = 2000  # Test drawings plotted in the feature space, shared across the categories
+
+# Rasterize one category's drawings: a uint8 array of 28x28 images, white strokes
+# on black, drawn in batches across every CPU (see rasterize.py)
+def render_category(category):
+    qd_group = QuickDrawDataGroup(category, max_drawings=IMAGES_PER_CATEGORY, recognized=True)
+    drawings = [drawing.image_data for drawing in qd_group.drawings]
+    return rasterize_all(drawings, IMG_SIZE, STROKE_WIDTH)
+
+# Make sure every category's drawings are rasterized into a .npy shard (see
+# shards.py; only the first run renders them) and return the shard paths in
+# label order. Training streams from these files rather than loading them.
+def prepare_shards():
+    paths = []
+    for category in CATEGORIES:
         print(f"Loading {category} data...")
-        qd_group = QuickDrawDataGroup(category, max_drawings=IMAGES_PER_CATEGORY, recognized=True)
-        images = []
-        
-        for drawing in qd_group.drawings:
-            img = drawing.get_image(stroke_width=3).resize(IMG_SIZE).convert("L")
-            img_array = np.array(img)
-            img_array = 255 - img_array
-            images.append(img_array)
-        
-        x_data.extend(images)
-        y_data.extend([idx] * len(images))
-    
-    x_data = np.array(x_data).reshape(-1, 28, 28, 1).astype('float32') / 255
-    y_data = tf.keras.utils.to_categorical(y_data, NUM_CLASSES)
-    
-    x_train, x_test, y_train, y_test = train_test_split(x_data, y_data, test_size=0.2, random_state=42)
-    
-    return x_train, y_train, x_test, y_test
+        cached_images(category, IMG_SIZE, STROKE_WIDTH, IMAGES_PER_CATEGORY,
+                      lambda: render_category(category))
+        paths.append(shard_path(category, IMG_SIZE, STROKE_WIDTH, IMAGES_PER_CATEGORY))
+    return paths
 
 # Build and train CNN model using Functional API
 def build_and_train_model():
-    x_train, y_train, x_test, y_test = load_and_preprocess_data()
+    paths = prepare_shards()
+    stall_timer = InputStallTimer()
+    train_data = stall_timer.watch(streaming_dataset(paths, IMG_SIZE, "train", batch_size=128))
+    test_data = streaming_dataset(paths, IMG_SIZE, "test", batch_size=128, shuffle=False)
+    x_test, y_test = test_sample(paths, IMG_SIZE, max(1, TSNE_POINTS // NUM_CLASSES))
     
     inputs = layers.Input(shape=(28, 28, 1))
     x = layers.Conv2D(32, (3, 3), activation='relu')(inputs)
@@ -63,7 +66,7 @@ def build_and_train_model():
                   loss='categorical_crossentropy',
                   metrics=['accuracy'])
     
-    model.fit(x_train, y_train, epochs=10, batch_size=128, validation_data=(x_test, y_test))
+    model.fit(train_data, epochs=10, validation_data=test_data, callbacks=[stall_timer])
     return model, x_test, y_test
 
 # Visualize the CNN's feature space with optional doodle point
@@ -223,6 +226,11 @@ def open_doodle_dialog(self):
 
 
 if __name__ == "__main__":
+    # python images.py --all-categories trains on every Quick, Draw! category
+    if "--all-categories" in sys.argv:
+        CATEGORIES = list(QUICK_DRAWING_NAMES)
+        NUM_CLASSES = len(CATEGORIES)
+    
     print("Training model...")
     model, x_test, y_test = build_and_train_model()
     
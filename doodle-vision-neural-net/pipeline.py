@@ -0,0 +1,121 @@
+import math
+import time
+import numpy as np
+import tensorflow as tf
+
+TEST_SPLIT = 0.2  # The last 20% of every shard is held out for validation
+SHUFFLE_BUFFER = 20000  # Images held for shuffling; as raw uint8 that's ~16MB
+READ_BUFFER = 64 * 1024  # Bytes read ahead from each open shard
+
+# Where the images start in a .npy shard written by shards.py, and how many
+# there are; the images themselves are fixed-size uint8 records after that
+def shard_layout(path):
+    with open(path, "rb") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, _, _ = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, _ = np.lib.format.read_array_header_2_0(f)
+        return f.tell(), shape[0]
+
+# Where a shard's training or test images are, as (bytes to skip at the
+# start, bytes to skip at the end, number of images)
+def shard_part(path, img_size, part):
+    width, height = img_size
+    offset, count = shard_layout(path)
+    test_count = int(count * TEST_SPLIT)
+    if part == "train":
+        return offset, test_count * width * height, count - test_count
+    return offset + (count - test_count) * width * height, 0, test_count
+
+# A tf.data pipeline streaming (images, one-hot labels) batches from shards,
+# one per class in label order, without loading them into memory. Every
+# shard is read in step (so batches mix all the classes), then images are
+# shuffled through a bounded buffer, batched, and scaled to [0, 1] floats
+# only once they're batched, while the next batches are prepared.
+def streaming_dataset(paths, img_size, part="train", batch_size=128, shuffle=True):
+    width, height = img_size
+    headers, footers, counts = zip(*(shard_part(path, img_size, part) for path in paths))
+    files = tf.data.Dataset.from_tensor_slices((
+        list(paths),
+        np.array(headers, dtype=np.int64),
+        np.array(footers, dtype=np.int64),
+        np.arange(len(paths), dtype=np.int64),
+    ))
+    if shuffle:
+        files = files.shuffle(len(paths), reshuffle_each_iteration=True)
+
+    def read_shard(path, header, footer, label):
+        records = tf.data.FixedLengthRecordDataset(path, width * height, header, footer, buffer_size=READ_BUFFER)
+        return records.map(lambda record: (record, label))
+
+    def decode(records, labels):
+        images = tf.reshape(tf.io.decode_raw(records, tf.uint8), (-1, height, width, 1))
+        return tf.cast(images, tf.float32) / 255, tf.one_hot(labels, len(paths))
+
+    dataset = files.interleave(read_shard, cycle_length=len(paths), block_length=1,
+                               num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+    if shuffle:
+        dataset = dataset.shuffle(SHUFFLE_BUFFER, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size).map(decode, num_parallel_calls=tf.data.AUTOTUNE)
+    # tf.data can't tell how many batches are coming; Keras shows progress with it
+    dataset = dataset.apply(tf.data.experimental.assert_cardinality(math.ceil(sum(counts) / batch_size)))
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+# A few test images of every class from the shards, in memory as float32
+# arrays (images, one-hot labels) for plotting
+def test_sample(paths, img_size, per_class):
+    images = []
+    labels = []
+    for label, path in enumerate(paths):
+        shard = np.load(path, mmap_mode="r")
+        start = len(shard) - int(len(shard) * TEST_SPLIT)
+        sample = shard[start:start + per_class]
+        images.append(sample)
+        labels.append(np.full(len(sample), label))
+    images = np.concatenate(images).reshape(-1, img_size[1], img_size[0], 1).astype("float32")
+    images /= 255
+    return images, tf.keras.utils.to_categorical(np.concatenate(labels), len(paths))
+
+# Keras callback reporting how long training sat waiting for input each epoch.
+# Pass the training dataset through watch(): handing a batch over to the model
+# records the time, and a step has stalled from the moment it started until
+# its batch arrived. Each epoch's total, in seconds, is logged as input_stall
+# (so it's shown with the other metrics and kept in the History) and
+# appended to self.stalls. The first step isn't counted, since it also builds
+# the training graph.
+class InputStallTimer(tf.keras.callbacks.Callback):
+    def __init__(self):
+        super().__init__()
+        self.delivered = tf.Variable(0.0, dtype=tf.float64, trainable=False)
+        self.stalls = []
+
+    def watch(self, dataset):
+        def stamp(images, labels):
+            with tf.control_dependencies([self.delivered.assign(tf.timestamp())]):
+                return tf.identity(images), labels
+
+        # The stamp has to be taken as the model asks for the batch, so
+        # tf.data mustn't prefetch past it
+        options = tf.data.Options()
+        options.experimental_optimization.inject_prefetch = False
+        return dataset.map(stamp).with_options(options)
+
+    def on_train_begin(self, logs=None):
+        self.traced = False
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.stall = 0.0
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self.step_started = time.time()
+
+    def on_train_batch_end(self, batch, logs=None):
+        if self.traced:
+            self.stall += max(0.0, float(self.delivered.numpy()) - self.step_started)
+        self.traced = True
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.stalls.append(self.stall)
+        if logs is not None:
+            logs["input_stall"] = self.stall
@@ -0,0 +1,158 @@
+import os
+from itertools import chain
+from multiprocessing import Pool
+import numpy as np
+
+CANVAS_SIZE = 255  # QuickDraw strokes are in 0-255 coordinates, drawn on a 255x255 canvas by get_image()
+SAMPLE_STEP = 0.5  # Distance between line samples, in coverage cells
+CHUNK_SIZE = 500  # Drawings per batch, which bounds the size of rasterize()'s temporary arrays
+
+# PIL's bicubic kernel (a = -0.5), the filter Image.resize() uses by default
+def bicubic(x):
+    x = np.abs(x)
+    near = (1.5 * x - 2.5) * x * x + 1
+    far = ((-0.5 * x + 2.5) * x - 4) * x + 2
+    return np.where(x < 1, near, np.where(x < 2, far, 0.0))
+
+# How many whole pixels either side of its centre a line reaches along x and
+# along y. ImageDraw draws wide lines as polygons whose corners sit `half`
+# pixels off the line, rounded to the pixel grid on each axis.
+def line_reach(dx, dy, half):
+    length = np.maximum(np.hypot(dx, dy), 1e-9)
+    return np.floor(half * np.abs(dy) / length + 0.5), np.floor(half * np.abs(dx) / length + 0.5)
+
+# How wide, in canvas pixels, PIL really draws a line of each direction.
+# Because of that rounding a 3px line is 3px wide when horizontal but about
+# 2.1px at 10 degrees and 3.6px at 45; filling the polygon then adds up to
+# another pixel.
+def line_widths(dx, dy, stroke_width):
+    length = np.maximum(np.hypot(dx, dy), 1e-9)
+    width = np.where(dy == 0, 1.0, np.abs(dy) / length)
+    half = (stroke_width - 1) / 2
+    for side in (np.floor(half + 0.5), np.ceil(half - 0.5)):
+        reach_x, reach_y = line_reach(dx, dy, side)
+        width += (reach_x * np.abs(dy) + reach_y * np.abs(dx)) / length
+    return width
+
+# The part of a line's pixels across one axis that is on the canvas: strokes
+# run right up to 0 and 255, and canvas pixels only go from 0 to 254.
+# Returns the share of them kept and where the kept part is centred.
+def clip_to_canvas(position, reach):
+    low = np.maximum(position - reach - 0.5, -0.5)
+    high = np.minimum(position + reach + 0.5, CANVAS_SIZE - 0.5)
+    kept = np.clip((high - low) / (2 * reach + 1), 0, 1).astype(np.float32)
+    return kept, ((low + high) / 2).astype(np.float32)
+
+# How many coverage cells to split each output pixel into along one axis:
+# as many as fit while a cell stays at least as wide as the stroke, so one
+# stroke never covers more than a whole cell
+def cells_per_pixel(scale, stroke_width):
+    return max(1, int(scale // stroke_width))
+
+# The (size, cells + 2) matrix that downscales a row of coverage cells tiling
+# the canvas, plus one margin cell either side, to `size` output pixels with
+# PIL's bicubic filter. Image.resize() normalises each output pixel's weights
+# over the canvas pixels only, which brightens the edge pixels whose filter
+# reaches past it, so the margin cells are left out of that sum.
+def resample_weights(size, cells):
+    scale = CANVAS_SIZE / size
+    source = (np.arange(-1, cells + 1) + 0.5) * CANVAS_SIZE / cells
+    center = (np.arange(size) + 0.5) * scale
+    weights = bicubic((source - center[:, None]) / scale)
+    return (weights / weights[:, 1:-1].sum(axis=1, keepdims=True)).astype(np.float32)
+
+# Flatten the drawings' strokes into line segments: arrays x0, y0, x1, y1 and
+# the index of the drawing each segment belongs to. Each drawing is a list
+# of strokes, each stroke a pair (xs, ys) as in QuickDrawing.image_data.
+def segments(drawings):
+    strokes = [stroke for drawing in drawings for stroke in drawing]
+    lengths = np.array([len(xs) for xs, _ in strokes], dtype=np.int64)
+    xs = np.fromiter(chain.from_iterable(xs for xs, _ in strokes), dtype=np.float32, count=lengths.sum())
+    ys = np.fromiter(chain.from_iterable(ys for _, ys in strokes), dtype=np.float32, count=lengths.sum())
+    owner = np.repeat(np.arange(len(drawings)), [len(drawing) for drawing in drawings])
+    point_owner = np.repeat(owner, lengths)
+
+    # Every point but a stroke's last one starts a segment
+    starts = np.ones(len(xs), dtype=bool)
+    starts[np.cumsum(lengths)[lengths > 0] - 1] = False
+    starts = np.flatnonzero(starts)
+    return xs[starts], ys[starts], xs[starts + 1], ys[starts + 1], point_owner[starts]
+
+# Draw a batch of drawings straight at img_size: a uint8 array (N, height, width)
+# of white anti-aliased strokes on black, the same as
+# 255 - get_image(stroke_width).resize(img_size).convert("L") to within a few
+# gray levels on inked pixels (bench_rasterize.py measures it). Each line is
+# sampled every SAMPLE_STEP and its ink spread over a coarse grid of coverage
+# cells, a few per output pixel; a cell holds at most full coverage, so
+# crossing and retraced strokes don't pile up ink any more than on the
+# canvas. The grid is then downscaled with the same bicubic filter PIL uses,
+# so nothing is ever drawn at full resolution.
+def rasterize(drawings, img_size=(28, 28), stroke_width=3):
+    width, height = img_size
+    if not drawings:
+        return np.zeros((0, height, width), dtype=np.uint8)
+    cells_x = width * cells_per_pixel(CANVAS_SIZE / width, stroke_width)
+    cells_y = height * cells_per_pixel(CANVAS_SIZE / height, stroke_width)
+    cell_x = CANVAS_SIZE / cells_x  # in canvas pixels
+    cell_y = CANVAS_SIZE / cells_y
+
+    x0, y0, x1, y1, owner = segments(drawings)
+    dx = x1 - x0
+    dy = y1 - y0
+    area_width = (line_widths(dx, dy, stroke_width) / np.sqrt(cell_x * cell_y)).astype(np.float32)
+    reach_x, reach_y = line_reach(dx, dy, np.floor((stroke_width - 1) / 2 + 0.5))
+    length = np.hypot(dx / cell_x, dy / cell_y)  # in cells
+
+    # Split each segment into equal pieces no longer than SAMPLE_STEP and
+    # sample their midpoints; each sample carries its piece's area of line,
+    # less whatever of it falls off the canvas. PIL draws a zero-length
+    # segment (a tap) as a single canvas pixel, so it gets one sample that size.
+    pieces = np.maximum(np.ceil(length / SAMPLE_STEP), 1).astype(np.int64)
+    segment = np.repeat(np.arange(len(pieces)), pieces)
+    first = np.cumsum(pieces) - pieces
+    t = ((np.arange(len(segment)) - first[segment] + 0.5) / pieces[segment]).astype(np.float32)
+    canvas_x = x0[segment] + t * dx[segment]
+    canvas_y = y0[segment] + t * dy[segment]
+    area = np.where(length > 0, area_width * length / pieces, 1 / (cell_x * cell_y))[segment].astype(np.float32)
+    kept_x, canvas_x = clip_to_canvas(canvas_x, reach_x[segment])
+    kept_y, canvas_y = clip_to_canvas(canvas_y, reach_y[segment])
+    area *= kept_x * kept_y
+
+    # Canvas pixel x covers [x, x + 1), so a stroke through x is centred on
+    # x + 0.5; cell i is centred on (i + 0.5) * cell
+    sample_x = (canvas_x + 0.5) / cell_x - 0.5
+    sample_y = (canvas_y + 0.5) / cell_y - 0.5
+
+    # Share every sample between the 2x2 cells around it. The grid has a
+    # margin cell on each side for samples near the canvas edge.
+    left = np.floor(sample_x).astype(np.int64)
+    top = np.floor(sample_y).astype(np.int64)
+    right_share = (sample_x - left).astype(np.float32)
+    lower_share = (sample_y - top).astype(np.float32)
+    padded_x, padded_y = cells_x + 2, cells_y + 2
+    corner = owner[segment] * (padded_x * padded_y) + (top + 1) * padded_x + left + 1
+    index = np.concatenate([corner, corner + 1, corner + padded_x, corner + padded_x + 1])
+    weight = np.concatenate([(1 - right_share) * (1 - lower_share), right_share * (1 - lower_share),
+                             (1 - right_share) * lower_share, right_share * lower_share]) * np.tile(area, 4)
+    # Without any samples bincount() counts in int64; the rest wants float32
+    coverage = np.bincount(index, weights=weight, minlength=len(drawings) * padded_x * padded_y).astype(np.float32)
+    coverage = np.minimum(coverage.reshape(len(drawings), padded_y, padded_x), 1)
+    pixels = resample_weights(height, cells_y) @ coverage @ resample_weights(width, cells_x).T
+    return np.rint(np.clip(pixels, 0, 1) * 255).astype(np.uint8)
+
+def _rasterize_chunk(args):
+    return rasterize(*args)
+
+# rasterize() for any number of drawings, in CHUNK_SIZE batches shared out
+# across a pool of processes (one per CPU by default; processes=1 stays in
+# this process)
+def rasterize_all(drawings, img_size=(28, 28), stroke_width=3, processes=None):
+    width, height = img_size
+    chunks = [(drawings[i:i + CHUNK_SIZE], img_size, stroke_width) for i in range(0, len(drawings), CHUNK_SIZE)]
+    if not chunks:
+        return np.zeros((0, height, width), dtype=np.uint8)
+    processes = min(processes or os.cpu_count() or 1, len(chunks))
+    if processes == 1:
+        return np.concatenate([_rasterize_chunk(chunk) for chunk in chunks])
+    with Pool(processes) as pool:
+        return np.concatenate(pool.map(_rasterize_chunk, chunks))
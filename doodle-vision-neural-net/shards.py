@@ -0,0 +1,45 @@
+import os
+import numpy as np
+
+# Rasterized drawings are cached next to the QuickDraw downloads
+SHARD_DIR = os.path.join(".quickdrawcache", "shards")
+SHARD_VERSION = 4  # Bump whenever rasterizing or preprocessing changes, so old shards are never reused
+
+# One shard per category and settings, e.g. cat-28x28-w3-n1000-v4.npy with
+# SHARD_VERSION 4
+def shard_path(category, img_size, stroke_width, count, shard_dir=SHARD_DIR):
+    width, height = img_size
+    name = f"{category}-{width}x{height}-w{stroke_width}-n{count}-v{SHARD_VERSION}.npy"
+    return os.path.join(shard_dir, name)
+
+# Memory-map a shard as a read-only uint8 array of shape (N, height, width);
+# only the pages that are actually read get loaded. None if missing or malformed.
+def load_shard(path, img_size):
+    if not os.path.exists(path):
+        return None
+    try:
+        images = np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    width, height = img_size
+    if images.dtype != np.uint8 or images.ndim != 3 or images.shape[1:] != (height, width):
+        return None
+    return images
+
+# Write through a temporary file so an interrupted run never leaves half a shard
+def save_shard(path, images):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = path + ".partial"
+    with open(partial, "wb") as f:
+        np.save(f, np.ascontiguousarray(images, dtype=np.uint8))
+    os.replace(partial, path)
+
+# A category's rasterized drawings: render() builds them on the first run and
+# they're saved as a shard, which every later run with the same settings maps
+def cached_images(category, img_size, stroke_width, count, render, shard_dir=SHARD_DIR):
+    path = shard_path(category, img_size, stroke_width, count, shard_dir)
+    images = load_shard(path, img_size)
+    if images is None:
+        save_shard(path, render())
+        images = load_shard(path, img_size)
+    return images
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+from rasterize import rasterize, rasterize_all
+
+IMG_SIZE = (28, 28)
+STROKE_WIDTH = 3
+INK_TOLERANCE = 4.0  # Mean difference from PIL over inked pixels, in gray levels
+PERCENTILE_TOLERANCE = 24  # 99th percentile of the same
+
+# Drawings as in QuickDrawing.image_data: lists of (xs, ys) strokes
+LINES = [
+    [([20, 230], [128, 128])],  # horizontal
+    [([40, 40], [10, 240])],  # vertical
+    [([10, 245], [10, 245])],  # diagonal
+    [([30, 200], [50, 90])],  # shallow
+    [([0, 254], [0, 0]), ([0, 0], [0, 254])],  # along the canvas edges
+    [([0, 255], [255, 255])],  # on the far edge
+]
+SHAPES = [
+    [([50, 200, 200, 50, 50], [50, 50, 200, 200, 50])],  # square
+    [([20, 230], [30, 220]), ([20, 230], [220, 30])],  # crossing strokes
+    [([60, 180, 60, 180], [100, 100, 104, 104])],  # retraced
+    [(np.rint(128 + 90 * np.cos(np.linspace(0, 6.3, 40))).astype(int).tolist(),
+      np.rint(128 + 60 * np.sin(np.linspace(0, 6.3, 40))).astype(int).tolist())],  # ellipse
+]
+
+# Random walks shaped roughly like QuickDraw strokes, the same every run
+def scribbles(count, seed=0):
+    rng = np.random.default_rng(seed)
+    drawings = []
+    for _ in range(count):
+        drawing = []
+        for _ in range(rng.integers(1, 6)):
+            points = rng.integers(2, 20)
+            heading = rng.uniform(0, 2 * np.pi) + rng.normal(0, 0.5, points).cumsum()
+            steps = np.stack([np.cos(heading), np.sin(heading)], 1) * rng.uniform(3, 12, (points, 1))
+            xy = np.rint(np.clip(rng.uniform(30, 225, 2) + steps.cumsum(0), 0, 255)).astype(int)
+            drawing.append((xy[:, 0].tolist(), xy[:, 1].tolist()))
+        drawings.append(drawing)
+    return drawings
+
+# 255 - get_image(stroke_width).resize(IMG_SIZE).convert("L"), without
+# downloading QuickDraw data
+def draw_with_pil(drawings):
+    images = []
+    for drawing in drawings:
+        image = Image.new("RGB", (255, 255), (255, 255, 255))
+        canvas = ImageDraw.Draw(image)
+        for xs, ys in drawing:
+            canvas.line(list(zip(xs, ys)), fill=(0, 0, 0), width=STROKE_WIDTH)
+        images.append(255 - np.array(image.resize(IMG_SIZE).convert("L")))
+    return np.array(images, dtype=np.uint8).reshape(-1, IMG_SIZE[1], IMG_SIZE[0])
+
+def difference_on_ink(drawings):
+    images = rasterize(drawings, IMG_SIZE, STROKE_WIDTH).astype(np.int16)
+    reference = draw_with_pil(drawings).astype(np.int16)
+    assert images.shape == reference.shape
+    return np.abs(images - reference)[(images > 0) | (reference > 0)]
+
+@pytest.mark.parametrize("drawings", [LINES, SHAPES, scribbles(200)], ids=["lines", "shapes", "scribbles"])
+def test_matches_pil_on_ink(drawings):
+    difference = difference_on_ink(drawings)
+    assert difference.mean() <= INK_TOLERANCE
+    assert np.percentile(difference, 99) <= PERCENTILE_TOLERANCE
+
+def test_overlapping_strokes_do_not_pile_up():
+    crossing, retraced = SHAPES[1:3]
+    assert difference_on_ink([crossing, retraced]).max() <= 2 * PERCENTILE_TOLERANCE
+
+def test_empty_batch():
+    assert rasterize([]).shape == (0, 28, 28)
+    assert rasterize_all([]).shape == (0, 28, 28)
+
+def test_drawings_without_strokes_are_blank():
+    assert not rasterize([[], []]).any()
+    images = rasterize([[], LINES[0]])
+    assert not images[0].any()
+    assert images[1].any()
+
+def test_single_point_strokes_are_blank_like_pil():
+    drawings = [[([100], [100])], [([100], [100]), ([50], [50])]]
+    assert not rasterize(drawings).any()
+    assert not draw_with_pil(drawings).any()
+
+def test_tap_matches_pil():
+    drawings = [[([100, 100], [50, 50])], [([100, 100], [50, 50]), ([10, 200], [30, 30])]]
+    images = rasterize(drawings).astype(np.int16)
+    reference = draw_with_pil(drawings).astype(np.int16)
+    assert images[0].any()
+    assert abs(images[0].sum() - reference[0].sum()) <= 0.25 * reference[0].sum()
+    assert np.abs(images - reference).max() <= PERCENTILE_TOLERANCE
+
+def test_rasterize_all_matches_rasterize():
+    drawings = scribbles(50, seed=1)
+    np.testing.assert_array_equal(rasterize_all(drawings, processes=1), rasterize(drawings))
@@ -1,26 +1,310 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
-from database import init_db, add_media_item, get_all_media, delete_media_item
-from url_scraper import extract_title_from_url, guess_media_type_from_url
+from flask import (Blueprint, Flask, Response, render_template, stream_template, request, redirect,
+                   url_for, flash, jsonify, abort, session, make_response, send_file,
+                   before_render_template, template_rendered)
+from database import (init_db, add_media_item, MediaPage, get_media_page, get_facet_counts, search_media, delete_media_item,
+                      get_data_version, iter_all_media, get_extraction_job, get_stats, rebuild_stats,
+                      find_media_by_url, get_media_item, find_similar, rebuild_similarity,
+                      release_connection, FEED_PAGE_SIZE)
+from url_scraper import cached_lookup, title_cache, session_stats
+from importer import import_links
+from jobs import extraction_queue
+from page_cache import PageCache
+from thumbnails import (thumbnail_queue, thumbnail_file, thumbnail_name, thumbnail_height,
+                        THUMBNAIL_WIDTHS)
+from backup import (backup_database, backup_runner, export_snapshot, restore_database,
+                    restore_snapshots, BackupError)
+import metrics
+from datetime import date
+from urllib.parse import urlencode
+import click
+import hashlib
+import json
+import logging
 import os
+import threading
+import time
+import zlib
 
-app = Flask(__name__)
-app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-change-this')
+# Every route and command lives on this blueprint; create_app() builds the app around it
+bp = Blueprint('main', __name__, cli_group=None)
 
 # Media types
 MEDIA_TYPES = ['books', 'podcasts', 'articles', 'websites', 'tweets']
 
-@app.route('/')
+# Rendered feed pages, reused until the data version changes
+feed_cache = PageCache()
+
+API_MAX_PAGE_SIZE = 200
+EXPORT_CHUNK_SIZE = 64 * 1024  # bytes of NDJSON gathered before each compress/send
+FEED_STREAM_CHUNK_SIZE = 8 * 1024  # characters of rendered feed gathered before each send
+THUMBNAIL_MAX_AGE = 365 * 24 * 60 * 60  # thumbnail URLs are content hashes, so never go stale
+
+logger = logging.getLogger(__name__)
+
+@bp.before_app_request
+def start_request_timer():
+    metrics.start_request()
+
+@bp.after_app_request
+def record_request_timing(response):
+    """
+    Record the request's latency and log it with its breakdown when slow.
+    Streamed responses are timed up to the first byte, not the whole body.
+    """
+    elapsed = metrics.request_elapsed()
+    if elapsed is None:
+        return response
+
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.REQUEST_DURATION.observe(elapsed, request.method, route, str(response.status_code))
+    if elapsed * 1000 >= metrics.SLOW_REQUEST_MS:
+        tally = metrics.request_tally()
+        metrics.SLOW_REQUESTS.inc(request.method, route)
+        logger.warning('Slow request: %s %s -> %s in %.1f ms (sql: %d statements, %.1f ms; '
+                       'render: %.1f ms; fetch: %.1f ms)', request.method, request.full_path.rstrip('?'),
+                       response.status_code, elapsed * 1000, tally['sql_statements'],
+                       tally['sql'] * 1000, tally['render'] * 1000, tally['fetch'] * 1000)
+    metrics.end_request()
+    return response
+
+# Template render timing via Flask's signals; includes nest inside one render
+_render_starts = threading.local()
+
+def _template_started(sender, template, context, **extra):
+    _render_starts.start = time.perf_counter()
+
+def _template_finished(sender, template, context, **extra):
+    start = getattr(_render_starts, 'start', None)
+    if start is not None:
+        metrics.observe_render(template.name, time.perf_counter() - start)
+        _render_starts.start = None
+
+@bp.app_template_filter('cursor')
+def encode_cursor(cursor):
+    """Turn a (created_at, id) page cursor into a query-string value."""
+    created_at, item_id = cursor
+    return f'{created_at},{item_id}'
+
+@bp.app_template_global()
+def thumbnail_url(key, ext, width=min(THUMBNAIL_WIDTHS)):
+    return url_for('main.thumbnail', name=thumbnail_name(key, width, ext))
+
+@bp.app_template_global()
+def thumbnail_srcset(key, ext):
+    """A srcset listing every width of one thumbnail format."""
+    return ', '.join(f'{thumbnail_url(key, ext, width)} {width}w' for width in THUMBNAIL_WIDTHS)
+
+@bp.app_context_processor
+def thumbnail_size():
+    """The smallest thumbnail's size, for the width and height that reserve its space."""
+    width = min(THUMBNAIL_WIDTHS)
+    return {'thumbnail_width': width, 'thumbnail_height': thumbnail_height(width)}
+
+def decode_cursor(value):
+    """Parse an `after` query-string value back into a (created_at, id) cursor."""
+    if not value:
+        return None
+    created_at, _, item_id = value.rpartition(',')
+    if not created_at or not item_id.isdigit():
+        abort(400)
+    return created_at, int(item_id)
+
+# Query-string names of the feed filters
+FILTER_ARGS = ('type', 'min_rating', 'from', 'to')
+
+def parse_filters(args):
+    """
+    Read the feed filters from the query string: type, min_rating and an
+    inclusive from/to date range (YYYY-MM-DD). Returns tuple: (filters,
+    filter_args) where filters are MediaPage keyword arguments and
+    filter_args the non-empty query-string values, for building links.
+    """
+    filter_args = {name: args[name] for name in FILTER_ARGS if args.get(name)}
+    filters = {}
+    try:
+        if 'type' in filter_args:
+            if filter_args['type'] not in MEDIA_TYPES:
+                raise ValueError()
+            filters['media_type'] = filter_args['type']
+        if 'min_rating' in filter_args:
+            filters['min_rating'] = parse_rating(filter_args['min_rating'])
+        if 'from' in filter_args:
+            filters['since'] = date.fromisoformat(filter_args['from']).isoformat()
+        if 'to' in filter_args:
+            filters['until'] = date.fromisoformat(filter_args['to']).isoformat()
+    except ValueError:
+        abort(400)
+    return filters, filter_args
+
+@bp.route('/')
 def index():
     """Main page showing the feed."""
-    return redirect(url_for('feed'))
+    return redirect(url_for('.feed'))
 
-@app.route('/feed')
+@bp.route('/feed')
 def feed():
-    """Display all media items in the feed."""
-    media_items = get_all_media()
-    return render_template('feed.html', media_items=media_items)
+    """Display one page of media items in the feed, optionally filtered."""
+    after = request.args.get('after')
+    cursor = decode_cursor(after)
+    filters, filter_args = parse_filters(request.args)
+
+    # Pages carrying flash messages are one-offs: never cache or revalidate
+    # them, and render them in one go, because a streamed page would pop the
+    # flashes after the session cookie has already been sent
+    if session.get('_flashes'):
+        return render_template('feed.html', **feed_context(cursor, after, filters, filter_args))
+
+    # The same version, filters and cursor always render the same bytes, so
+    # together they make a strong validator without hashing the body
+    version, updated_at = get_data_version()
+    key = urlencode(sorted(filter_args.items()) + [('after', after or '')])
+    etag = f'{version}-{hashlib.sha1(key.encode()).hexdigest()[:16]}'
+
+    if request.if_none_match.contains(etag):
+        body = ''  # make_conditional() turns this into a 304
+    else:
+        body = feed_cache.get(version, key)
+        if body is None:
+            context = feed_context(cursor, after, filters, filter_args)
+            body = cache_stream(stream_template('feed.html', **context), version, key)
+
+    response = make_response(body)
+    response.set_etag(etag)
+    response.last_modified = updated_at
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def feed_context(cursor, after, filters, filter_args):
+    """
+    Template context for one feed page. The items are a lazy MediaPage, read
+    while the template renders; the facet counts are per media type under
+    the other filters.
+    """
+    facet_filters = {name: value for name, value in filters.items() if name != 'media_type'}
+    return {
+        'media_items': MediaPage(cursor, **filters),
+        'after': after,
+        'filters': filter_args,
+        'media_types': MEDIA_TYPES,
+        'facets': get_facet_counts(MEDIA_TYPES, **facet_filters),
+    }
+
+def cache_stream(chunks, version, key):
+    """
+    Pass a template stream on in FEED_STREAM_CHUNK_SIZE pieces (Jinja yields
+    a tiny chunk per template statement) and store the whole page in
+    feed_cache once all of it has been sent.
+    """
+    sent = []
+    pending = []
+    pending_size = 0
+    for chunk in chunks:
+        pending.append(chunk)
+        pending_size += len(chunk)
+        if pending_size >= FEED_STREAM_CHUNK_SIZE:
+            piece = ''.join(pending)
+            sent.append(piece)
+            yield piece
+            pending = []
+            pending_size = 0
+    piece = ''.join(pending)
+    sent.append(piece)
+    yield piece
+    feed_cache.set(version, key, ''.join(sent))
+
+@bp.route('/search')
+def search():
+    """Full-text search over the feed."""
+    query = request.args.get('q', '').strip()
+    media_items = search_media(query) if query else []
+    return render_template('search.html', media_items=media_items, query=query)
+
+@bp.route('/similar/<int:item_id>')
+def similar(item_id):
+    """An item and the items most similar to it."""
+    item = get_media_item(item_id)
+    if item is None:
+        abort(404)
+    return render_template('similar.html', item=item, media_items=find_similar(item_id))
+
+@bp.cli.command('rebuild-similarity')
+def rebuild_similarity_command():
+    """Recompute the similar-items vectors from the media table."""
+    init_db()
+    rebuild_similarity()
+    click.echo('Similarity vectors rebuilt.')
+
+@bp.route('/thumbnails/<name>')
+def thumbnail(name):
+    """A stored thumbnail. Its name is a content hash, so browsers may keep it for good."""
+    path = thumbnail_file(name)
+    if path is None:
+        abort(404)
+    response = send_file(path, max_age=THUMBNAIL_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
+@bp.route('/stats')
+def stats():
+    """Counts per media type, rating histogram and average rating per month."""
+    return render_template('stats.html', stats=get_stats())
+
+@bp.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recompute the /stats summary table from the media table."""
+    init_db()
+    rebuild_stats()
+    click.echo('Statistics rebuilt.')
+
+@bp.route('/api/media')
+def api_media():
+    """
+    One page of media items as JSON, filtered like /feed; pass `next` back
+    as `after` (with the same filters) for the following page.
+    """
+    limit = min(max(request.args.get('limit', FEED_PAGE_SIZE, type=int), 1), API_MAX_PAGE_SIZE)
+    filters, _ = parse_filters(request.args)
+    media_items, next_cursor = get_media_page(decode_cursor(request.args.get('after')), limit, **filters)
+    return jsonify({
+        'items': media_items,
+        'next': encode_cursor(next_cursor) if next_cursor else None
+    })
+
+@bp.route('/api/media/export')
+def api_media_export():
+    """Stream every media item as NDJSON, gzip-compressed when the client accepts it."""
+    use_gzip = 'gzip' in request.accept_encodings
+
+    def generate():
+        # wbits=31 writes a gzip header and trailer around the deflate stream
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+        lines = []
+        size = 0
+        for item in iter_all_media():
+            line = json.dumps(item, ensure_ascii=False) + '\n'
+            lines.append(line)
+            size += len(line)
+            if size >= EXPORT_CHUNK_SIZE:
+                chunk = ''.join(lines).encode('utf-8')
+                lines, size = [], 0
+                chunk = compressor.compress(chunk) if compressor else chunk
+                if chunk:
+                    yield chunk
+
+        chunk = ''.join(lines).encode('utf-8')
+        if compressor:
+            chunk = compressor.compress(chunk) + compressor.flush()
+        if chunk:
+            yield chunk
+
+    response = Response(generate(), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = 'attachment; filename=media.ndjson'
+    response.vary.add('Accept-Encoding')
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
 
-@app.route('/add', methods=['GET', 'POST'])
+@bp.route('/add', methods=['GET', 'POST'])
 def add_media():
     """Add new media item."""
     if request.method == 'POST':
@@ -55,44 +339,212 @@ def add_media():
                                  url=url, title=title, authors=authors, 
                                  media_type=media_type, thoughts=thoughts)
         
+        existing = find_media_by_url(url)
+        if existing is not None:
+            flash(f'That link is already in your feed as "{existing["title"]}"!', 'error')
+            return render_template('add.html', media_types=MEDIA_TYPES,
+                                 url=url, title=title, authors=authors,
+                                 media_type=media_type, rating=rating, thoughts=thoughts)
+
+        # The preview image found when the title was extracted, if it was
+        looked_up = cached_lookup(url) if url else None
+        image_url = looked_up['image_url'] if looked_up else None
+
         # Add to database
         try:
-            add_media_item(title, authors, media_type, rating, thoughts, url)
+            add_media_item(title, authors, media_type, rating, thoughts, url, image_url)
+            thumbnail_queue.submit(image_url)
             flash('Media item added successfully!', 'success')
-            return redirect(url_for('feed'))
+            return redirect(url_for('.feed'))
         except Exception as e:
             flash(f'Error adding media item: {str(e)}', 'error')
     
     return render_template('add.html', media_types=MEDIA_TYPES)
 
-@app.route('/extract_title', methods=['POST'])
+def parse_rating(value):
+    """Parse an optional 1-10 rating; returns None when blank and raises ValueError when invalid."""
+    if value in (None, ''):
+        return None
+    rating = int(value)
+    if rating < 1 or rating > 10:
+        raise ValueError()
+    return rating
+
+@bp.route('/import', methods=['GET', 'POST'])
+def import_media():
+    """Bulk import a list of URLs, a CSV file or a bookmark export."""
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        text = upload.read().decode('utf-8', errors='replace') if upload and upload.filename else ''
+        text = text or request.form.get('urls', '')
+
+        try:
+            rating = parse_rating(request.form.get('rating'))
+        except ValueError:
+            flash('Rating must be a number between 1 and 10!', 'error')
+            return render_template('import.html', urls=request.form.get('urls', ''))
+
+        if not text.strip():
+            flash('Paste some URLs or choose a file to import!', 'error')
+            return render_template('import.html')
+
+        try:
+            ids, duplicates = import_links(text, MEDIA_TYPES, default_rating=rating)
+        except Exception as e:
+            flash(f'Error importing media items: {str(e)}', 'error')
+            return render_template('import.html', urls=request.form.get('urls', ''))
+
+        message = f'Imported {len(ids)} media items!'
+        if duplicates:
+            message += f' Skipped {duplicates} already in your feed.'
+        flash(message, 'success')
+        return redirect(url_for('.feed'))
+
+    return render_template('import.html')
+
+@bp.cli.command('import-links')
+@click.argument('path', type=click.File('r', encoding='utf-8'))
+@click.option('--rating', type=click.IntRange(1, 10), help='Rating for rows that do not carry one.')
+@click.option('--workers', default=16, show_default=True, help='Concurrent lookups in total.')
+@click.option('--per-host', default=2, show_default=True, help='Concurrent lookups per host.')
+@click.option('--timeout', default=10.0, show_default=True, help='Seconds per request.')
+def import_links_command(path, rating, workers, per_host, timeout):
+    """Import a URL list, CSV file or bookmark export (use - for stdin)."""
+    init_db()
+    ids, duplicates = import_links(path.read(), MEDIA_TYPES, default_rating=rating,
+                                   workers=workers, per_host=per_host, timeout=timeout)
+    click.echo(f'Imported {len(ids)} media items, skipped {duplicates} already in the feed.')
+
+def job_response(job):
+    """JSON body describing an extraction job."""
+    success = job['status'] == 'done'
+    body = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'success': success,
+        'title': job['title'],
+        'media_type': job['media_type']
+    }
+    if job['status'] in ('done', 'failed'):
+        body['message'] = 'Title extracted successfully!' if success else 'Could not extract title automatically'
+    else:
+        body['status_url'] = url_for('.extract_title_status', job_id=job['id'])
+    return body
+
+@bp.route('/extract_title', methods=['POST'])
 def extract_title():
-    """AJAX endpoint to extract title from URL."""
+    """
+    AJAX endpoint to extract title from URL. Cached results come back at once;
+    otherwise a background job is queued (202) and its status_url can be polled.
+    """
     data = request.get_json()
     url = data.get('url', '').strip()
     
     if not url:
         return jsonify({'success': False, 'error': 'No URL provided'})
+
+    existing = find_media_by_url(url)
+    if existing is not None:
+        return jsonify({
+            'job_id': None,
+            'status': 'duplicate',
+            'success': False,
+            'duplicate': True,
+            'existing_id': existing['id'],
+            'title': existing['title'],
+            'media_type': existing['media_type'],
+            'message': 'This link is already in your feed.'
+        })
     
-    title, success = extract_title_from_url(url)
-    media_type = guess_media_type_from_url(url)
-    
-    return jsonify({
-        'success': success,
-        'title': title,
-        'media_type': media_type,
-        'message': 'Title extracted successfully!' if success else 'Could not extract title automatically'
-    })
+    job = extraction_queue.submit(url)
+    return jsonify(job_response(job)), 200 if job['status'] in ('done', 'failed') else 202
+
+@bp.route('/extract_title/<int:job_id>')
+def extract_title_status(job_id):
+    """Poll an extraction job."""
+    job = get_extraction_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    return jsonify(job_response(job))
 
-@app.route('/delete/<int:item_id>', methods=['POST'])
+@bp.route('/extract_title/stats')
+def extract_title_stats():
+    """Lookup cache hit/miss counters and HTTP connection reuse."""
+    return jsonify({'cache': title_cache.stats(), 'http': session_stats()})
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    """Request, SQL, template and fetch timings in the Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/backup', methods=['GET', 'POST'])
+def backup():
+    """POST starts an online backup in the background (202); GET reports on the latest one."""
+    if request.method == 'POST':
+        return jsonify(backup_runner.start()), 202
+    return jsonify(backup_runner.status())
+
+@bp.cli.command('backup')
+@click.argument('dest', required=False)
+@click.option('--pages', default=256, show_default=True, help='Pages copied per step.')
+@click.option('--pause', default=0.005, show_default=True, help='Seconds to sleep between steps.')
+def backup_command(dest, pages, pause):
+    """Copy the live database to DEST (default: a timestamped file in backups/)."""
+    init_db()
+    path = backup_database(dest, pages=pages, pause=pause)
+    click.echo(f'Backed up to {path}.')
+
+@bp.cli.command('snapshot')
+@click.option('--full', is_flag=True, help='Export every row instead of the changes since the last snapshot.')
+def snapshot_command(full):
+    """Export a compressed snapshot of the rows changed since the last one."""
+    init_db()
+    snapshot = export_snapshot(full=full)
+    if snapshot is None:
+        click.echo('Nothing changed since the last snapshot.')
+    else:
+        click.echo(f"Wrote {snapshot['kind']} snapshot {snapshot['filename']} ({snapshot['rows']} rows).")
+
+@bp.cli.command('restore')
+@click.argument('source', type=click.Path(exists=True))
+def restore_command(source):
+    """Restore from a backup file, or from a snapshot directory, after verifying it."""
+    init_db()
+    try:
+        if os.path.isdir(source):
+            count = restore_snapshots(source)
+        else:
+            count = restore_database(source)
+    except BackupError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'Restored {count} media items.')
+
+@bp.route('/delete/<int:item_id>', methods=['POST'])
 def delete_item(item_id):
     """Delete a media item."""
     if delete_media_item(item_id):
         flash('Item deleted successfully!', 'success')
     else:
         flash('Item not found!', 'error')
-    return redirect(url_for('feed'))
+    return redirect(url_for('.feed'))
 
-if __name__ == '__main__':
+def create_app():
+    """
+    Build the app and make sure the schema is current. Multi-process servers
+    call this once in every worker (see gunicorn.conf.py); init_db is safe to
+    run from several workers at once.
+    """
+    app = Flask(__name__)
+    app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-change-this')
+    app.register_blueprint(bp)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+    # Each request's database connection goes back to the pool when it ends
+    app.teardown_appcontext(release_connection)
     init_db()
+    return app
+
+if __name__ == '__main__':
+    app = create_app()
+    extraction_queue.resume()
     app.run(debug=True, port=5000) 
\ No newline at end of file
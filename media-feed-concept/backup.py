@@ -0,0 +1,259 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+from itertools import islice
+
+import database
+
+BACKUP_DIR = os.environ.get('BACKUP_DIR', 'backups')
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(BACKUP_DIR, 'snapshots'))
+BACKUP_PAGES = 256  # pages copied per backup step (1 MB with 4 KB pages)
+BACKUP_PAUSE = 0.005  # seconds to sleep between steps, leaving the disk and GIL to requests
+RESTORE_BATCH_SIZE = 1000  # snapshot rows read and applied at a time, so memory stays flat
+SNAPSHOT_FORMAT = 1
+MANIFEST = 'manifest.json'
+
+class BackupError(Exception):
+    """A backup or snapshot failed verification."""
+
+def backup_database(dest=None, pages=BACKUP_PAGES, pause=BACKUP_PAUSE, progress=None):
+    """
+    Copy the live database to `dest` (default: a timestamped file in
+    BACKUP_DIR) with SQLite's online backup API, `pages` pages per step.
+
+    The source connection holds one read transaction for the whole copy, so
+    under WAL the backup sees a consistent snapshot while writers carry on;
+    without it any write would restart the copy from the first page. The
+    pause between steps keeps a large backup from hogging the process.
+    progress(remaining, total) is called after each step. Returns the path.
+    """
+    if dest is None:
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        dest = os.path.join(BACKUP_DIR, f'media_feed-{datetime.now():%Y%m%d-%H%M%S}.db')
+
+    def step(status, remaining, total):
+        if progress is not None:
+            progress(remaining, total)
+        if remaining and pause:
+            time.sleep(pause)
+
+    partial = dest + '.partial'
+    source = sqlite3.connect(database.DATABASE, timeout=database.BUSY_TIMEOUT, isolation_level=None)
+    target = sqlite3.connect(partial)
+    try:
+        source.execute('BEGIN')
+        source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        source.backup(target, pages=pages, progress=step)
+        source.execute('COMMIT')
+    finally:
+        target.close()
+        source.close()
+
+    verify_database(partial)
+    os.replace(partial, dest)
+    return dest
+
+def verify_database(path):
+    """
+    Check that `path` is an intact media database: integrity_check passes and
+    the media table is readable. Returns its item count; raises BackupError.
+    """
+    if not os.path.exists(path):
+        raise BackupError(f'{path} does not exist')
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        result = conn.execute('PRAGMA integrity_check').fetchall()
+        if result != [('ok',)]:
+            raise BackupError(f'{path} failed integrity_check: ' + '; '.join(r[0] for r in result[:5]))
+        return conn.execute('SELECT COUNT(*) FROM media').fetchone()[0]
+    except sqlite3.DatabaseError as e:
+        raise BackupError(f'{path} is not a usable media database: {e}') from e
+    finally:
+        conn.close()
+
+def restore_database(path, pages=-1):
+    """
+    Verify the database file at `path` and copy it over the live database
+    with the backup API. Returns the restored item count.
+    """
+    count = verify_database(path)
+    previous_version = database.get_data_version()[0]
+
+    source = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        source.backup(database.get_connection(), pages=pages)
+    finally:
+        source.close()
+
+    database.mark_restored(previous_version)
+    return count
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _write_manifest(directory):
+    """Rewrite the snapshot directory's manifest from the snapshots table."""
+    manifest = {'format': SNAPSHOT_FORMAT, 'snapshots': database.get_snapshots()}
+    partial = os.path.join(directory, MANIFEST + '.partial')
+    with open(partial, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(partial, os.path.join(directory, MANIFEST))
+
+def export_snapshot(directory=SNAPSHOT_DIR, full=False):
+    """
+    Write a gzipped JSON-lines snapshot of the rows changed since the last
+    snapshot (or of every row, for the first one or with full=True) and
+    record it in the snapshots table and the directory's manifest.
+    Returns the snapshot dict, or None when nothing changed.
+    """
+    os.makedirs(directory, exist_ok=True)
+    snapshots = database.get_snapshots()
+    base = 0 if full or not snapshots else snapshots[-1]['last_change_id']
+    last = database.get_last_change_id()
+    kind = 'full' if full or not snapshots else 'incremental'
+    if kind == 'incremental' and last <= base:
+        return None
+
+    filename = f'snapshot-{datetime.now():%Y%m%d-%H%M%S-%f}-{kind}.jsonl.gz'
+    path = os.path.join(directory, filename)
+    rows = 0
+    with gzip.open(path + '.partial', 'wt', encoding='utf-8') as f:
+        f.write(json.dumps({'format': SNAPSHOT_FORMAT, 'kind': kind,
+                            'base_change_id': base, 'last_change_id': last}) + '\n')
+        changes = database.iter_snapshot_rows(None if kind == 'full' else base, last)
+        for media_id, row in changes:
+            entry = {'op': 'upsert', 'row': row} if row is not None else {'op': 'delete', 'id': media_id}
+            f.write(json.dumps(entry) + '\n')
+            rows += 1
+    os.replace(path + '.partial', path)
+
+    snapshot_id = database.record_snapshot(kind, base, last, filename, rows, _sha256(path))
+    _write_manifest(directory)
+    return next(s for s in database.get_snapshots() if s['id'] == snapshot_id)
+
+def _read_snapshot(path, expected):
+    """Yield a snapshot file's (media_id, row) entries after checking its header against the manifest."""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        if (header.get('format') != SNAPSHOT_FORMAT or header['kind'] != expected['kind']
+                or header['last_change_id'] != expected['last_change_id']):
+            raise BackupError(f'{path} does not match its manifest entry')
+        for line in f:
+            entry = json.loads(line)
+            if entry['op'] == 'delete':
+                yield entry['id'], None
+            else:
+                yield entry['row']['id'], entry['row']
+
+def rebuild_from_snapshots(directory, target):
+    """
+    Build a new database at `target` from the snapshot chain in `directory`:
+    the latest full snapshot plus every incremental one after it. Each file's
+    checksum and place in the chain are checked before it is applied, its
+    rows are streamed in RESTORE_BATCH_SIZE at a time and counted against
+    the manifest, and the similar-items vectors are rebuilt once at the end.
+    The result is verified afterwards. Returns the item count.
+    """
+    if os.path.exists(target):
+        raise BackupError(f'{target} already exists')
+    with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+        snapshots = json.load(f)['snapshots']
+
+    fulls = [i for i, s in enumerate(snapshots) if s['kind'] == 'full']
+    if not fulls:
+        raise BackupError(f'no full snapshot in {directory}')
+    chain = snapshots[fulls[-1]:]
+    for previous, snapshot in zip(chain, chain[1:]):
+        if snapshot['base_change_id'] != previous['last_change_id']:
+            raise BackupError(f"snapshot {snapshot['filename']} does not follow {previous['filename']}")
+    for snapshot in chain:
+        path = os.path.join(directory, snapshot['filename'])
+        if not os.path.exists(path) or _sha256(path) != snapshot['sha256']:
+            raise BackupError(f"snapshot {snapshot['filename']} is missing or corrupt")
+
+    database.init_db(target)
+    conn = database.connect(target)
+    live_ids = set()
+    try:
+        for snapshot in chain:
+            entries = _read_snapshot(os.path.join(directory, snapshot['filename']), snapshot)
+            rows = 0
+            with conn:
+                while True:
+                    batch = list(islice(entries, RESTORE_BATCH_SIZE))
+                    if not batch:
+                        break
+                    database.apply_snapshot_rows(conn, batch)
+                    rows += len(batch)
+                    for media_id, row in batch:
+                        if row is None:
+                            live_ids.discard(media_id)
+                        else:
+                            live_ids.add(media_id)
+                if rows != snapshot['rows']:
+                    raise BackupError(f"snapshot {snapshot['filename']} has {rows} rows, "
+                                      f"expected {snapshot['rows']}")
+        database.rebuild_similarity(conn)
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        conn.close()
+
+    count = verify_database(target)
+    if count != len(live_ids):
+        raise BackupError(f'rebuilt database has {count} items, snapshots describe {len(live_ids)}')
+    return count
+
+def restore_snapshots(directory=SNAPSHOT_DIR):
+    """Rebuild the database from snapshots into a scratch file, verify it, then restore it live."""
+    with tempfile.TemporaryDirectory() as scratch:
+        target = os.path.join(scratch, 'restore.db')
+        rebuild_from_snapshots(directory, target)
+        return restore_database(target)
+
+class BackupRunner:
+    """Runs one online backup at a time on a background thread and reports on it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status = {'state': 'idle'}
+
+    def start(self, dest=None):
+        """Start a backup unless one is already running. Returns the status."""
+        with self._lock:
+            if self._status['state'] == 'running':
+                return dict(self._status)
+            self._status = {'state': 'running', 'started_at': time.time(),
+                            'pages_total': None, 'pages_remaining': None}
+            threading.Thread(target=self._run, args=(dest,), name='backup', daemon=True).start()
+            return dict(self._status)
+
+    def status(self):
+        with self._lock:
+            return dict(self._status)
+
+    def _progress(self, remaining, total):
+        with self._lock:
+            self._status.update(pages_total=total, pages_remaining=remaining)
+
+    def _run(self, dest):
+        try:
+            path = backup_database(dest, progress=self._progress)
+            update = {'state': 'done', 'path': path, 'size': os.path.getsize(path)}
+        except Exception as e:
+            update = {'state': 'failed', 'error': str(e)}
+        finally:
+            database.release_connection()
+        with self._lock:
+            self._status.update(update, finished_at=time.time())
+
+backup_runner = BackupRunner()
@@ -0,0 +1,54 @@
+"""
+Insert throughput: add_media_items (executemany in one transaction) versus
+one add_media_item call per row.
+
+    python benchmarks/bench_bulk_insert.py --rows 1000000 --chunk-size 5000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import database
+
+
+def rows(count):
+    for i in range(count):
+        yield (f'Bulk item {i}', f'Author {i % 1000}', 'articles', i % 10 + 1,
+               f'Some thoughts about item {i}', f'https://example.com/{i}')
+
+def fresh_database(name):
+    database.DATABASE = os.path.join(tempfile.mkdtemp(), name)
+    database.init_db()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000, help='rows for the bulk insert')
+    parser.add_argument('--chunk-size', type=int, default=database.INSERT_CHUNK_SIZE)
+    parser.add_argument('--single-rows', type=int, default=2000,
+                        help='rows for the one-call-per-row baseline (extrapolated)')
+    args = parser.parse_args()
+
+    fresh_database('single.db')
+    start = time.perf_counter()
+    for row in rows(args.single_rows):
+        database.add_media_item(*row)
+    single_rate = args.single_rows / (time.perf_counter() - start)
+
+    fresh_database('bulk.db')
+    start = time.perf_counter()
+    ids = database.add_media_items(rows(args.rows), chunk_size=args.chunk_size)
+    bulk_elapsed = time.perf_counter() - start
+    assert ids == list(range(1, args.rows + 1))
+
+    print(f'add_media_item per row: {single_rate:>10.0f} rows/s '
+          f'({args.rows / single_rate / 60:.1f} min for {args.rows} rows)')
+    print(f'add_media_items:        {args.rows / bulk_elapsed:>10.0f} rows/s '
+          f'({bulk_elapsed:.1f}s for {args.rows} rows)')
+
+
+if __name__ == '__main__':
+    main()
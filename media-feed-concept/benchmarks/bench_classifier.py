@@ -0,0 +1,76 @@
+"""
+Microbenchmark for guess_media_type_from_url: the compiled rule table versus
+the old substring scans, and how the rule table scales with thousands of rules.
+
+    python benchmarks/bench_classifier.py --rules 10000
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from media_rules import MediaClassifier, load_classifier
+
+SAMPLE_URLS = [
+    'https://x.com/someone/status/1',
+    'https://www.goodreads.com/book/show/4671.The_Great_Gatsby',
+    'https://podcasts.apple.com/us/podcast/99-invisible/id394775318',
+    'https://someone.substack.com/p/a-post',
+    'https://example.com/blog/2024/01/hello',
+    'https://www.dropbox.com/s/abc/file.pdf',
+    'https://en.wikipedia.org/wiki/Unicode',
+    'https://www.amazon.com/dp/B000FC0SIM',
+]
+
+
+def legacy_guess(url):
+    """The substring-scan implementation this replaced."""
+    if not url:
+        return None
+    url = url.lower()
+    if 'twitter.com' in url or 'x.com' in url:
+        return 'tweets'
+    elif any(domain in url for domain in ['spotify.com', 'apple.com/podcasts', 'overcast.fm', 'pocketcasts.com']):
+        return 'podcasts'
+    elif any(domain in url for domain in ['goodreads.com', 'amazon.com/dp', 'books.google.com']):
+        return 'books'
+    elif any(domain in url for domain in ['medium.com', 'substack.com', 'blog.', '/blog/', 'article']):
+        return 'articles'
+    else:
+        return 'websites'
+
+def per_call_ns(fn, number):
+    def run():
+        for url in SAMPLE_URLS:
+            fn(url)
+    return min(timeit.repeat(run, number=number, repeat=5)) / (number * len(SAMPLE_URLS)) * 1e9
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rules', type=int, default=10000, help='synthetic host rules for the scaling run')
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    classifier = load_classifier()
+    for url in SAMPLE_URLS:
+        if classifier.classify(url) != legacy_guess(url):
+            print(f'differs from legacy: {url} -> {classifier.classify(url)} (was {legacy_guess(url)})')
+
+    rng = random.Random(0)
+    types = ['books', 'podcasts', 'articles', 'tweets']
+    big_rules = [{'media_type': rng.choice(types), 'host': f'site{i}.example{i % 50}.com'}
+                 for i in range(args.rules)]
+    big_rules += [{'media_type': 'articles', 'pattern': f'/section{i}/'} for i in range(20)]
+    big = MediaClassifier(big_rules)
+
+    print(f"{'implementation':<30}{'ns/url':>10}")
+    print(f"{'legacy substring scans':<30}{per_call_ns(legacy_guess, args.number):>10.0f}")
+    print(f"{'rule table (shipped rules)':<30}{per_call_ns(classifier.classify, args.number):>10.0f}")
+    print(f"{f'rule table ({len(big_rules)} rules)':<30}{per_call_ns(big.classify, args.number):>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
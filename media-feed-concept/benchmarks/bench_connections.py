@@ -0,0 +1,148 @@
+"""
+Requests/sec for /feed and /add with the old connect-per-call data layer
+versus the pooled, WAL-tuned connections in database.py.
+
+    python benchmarks/bench_connections.py --rows 200 --requests 2000 --clients 4
+
+Both run on the threaded development server that `python app.py` starts,
+which handles every request on a new thread, with client processes sending
+the requests. Connections opened counts every sqlite3 connection made while
+measuring.
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import Pool
+
+import requests
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as app_module
+import database
+
+
+opened = 0  # connections made in this process while measuring
+
+
+def counted_connect(*args, **kwargs):
+    global opened
+    opened += 1
+    return pooled_connect(*args, **kwargs)
+
+pooled_connect = database.connect
+
+# The data layer as it was before pooling: one untuned connection per call
+def legacy_add_media_item(title, authors, media_type, rating, thoughts, url=None, image_url=None):
+    global opened
+    opened += 1
+    conn = sqlite3.connect(database.DATABASE)
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO media (title, authors, media_type, rating, thoughts, url)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (title, authors, media_type, rating, thoughts, url))
+    conn.commit()
+    conn.close()
+    return cursor.lastrowid
+
+def legacy_get_media_page(after=None, limit=database.FEED_PAGE_SIZE):
+    global opened
+    opened += 1
+    conn = sqlite3.connect(database.DATABASE)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT id, title, authors, media_type, rating, thoughts, url, created_at
+        FROM media
+        ORDER BY created_at DESC, id DESC
+        LIMIT ?
+    ''', (limit,))
+    items = cursor.fetchall()
+    conn.close()
+    return [dict(zip(database.MEDIA_COLUMNS, item)) for item in items], None
+
+def client(job):
+    """One client process: send its share of requests over a keep-alive session; returns failures."""
+    url, method, count, form = job
+    session = requests.Session()
+    failures = 0
+    for _ in range(count):
+        if method == 'POST':
+            response = session.post(url, data=form, allow_redirects=False)
+        else:
+            response = session.get(url)
+        failures += response.status_code not in (200, 302)
+    return failures
+
+def drive(clients, base, path, method, total, form=None):
+    """Issue `total` requests from the client processes; returns (req/s, connections opened)."""
+    global opened
+    per_client = total // len(clients._pool)
+    jobs = [(base + path, method, per_client, form)] * len(clients._pool)
+    opened = 0
+    start = time.perf_counter()
+    failures = sum(clients.map(client, jobs))
+    elapsed = time.perf_counter() - start
+    assert not failures, f'{failures} requests to {path} failed'
+    return per_client * len(jobs) / elapsed, opened
+
+def run(mode, args, clients):
+    database.DATABASE = os.path.join(tempfile.mkdtemp(), f'{mode}.db')
+    app = app_module.create_app()
+    # Render /feed on every request, so it measures the data layer and not the page cache
+    app_module.feed_cache.max_entries = 0
+    if mode == 'legacy':
+        app_module.add_media_item = legacy_add_media_item
+        app_module.MediaPage = lambda after=None: legacy_get_media_page(after)[0]
+    else:
+        app_module.add_media_item = database.add_media_item
+        app_module.MediaPage = database.MediaPage
+        database.connect = counted_connect
+
+    for i in range(args.rows):
+        app_module.add_media_item(f'Seed item {i}', 'Someone', 'articles', 7, 'Seed thoughts', None)
+    database.close_connection()
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+    form = {'title': 'Bench item', 'authors': 'Bench', 'media_type': 'books',
+            'rating': '8', 'thoughts': 'Benchmark insert', 'url': ''}
+    try:
+        return {
+            '/feed': drive(clients, base, '/feed', 'GET', args.requests),
+            '/add': drive(clients, base, '/add', 'POST', args.requests, form),
+        }
+    finally:
+        server.shutdown()
+        database.connect = pooled_connect
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200, help='rows seeded before measuring')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per route')
+    parser.add_argument('--clients', type=int, default=4, help='concurrent client processes')
+    args = parser.parse_args()
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # no line per request
+
+    # Start the clients before any server thread, so forking them copies no threads
+    with Pool(args.clients) as clients:
+        before = run('legacy', args, clients)
+        after = run('pooled', args, clients)
+
+    print(f"{'route':<8}{'before req/s':>14}{'after req/s':>14}{'speedup':>10}"
+          f"{'connections before':>20}{'after':>8}")
+    for route in before:
+        (before_rps, before_opened), (after_rps, after_opened) = before[route], after[route]
+        print(f'{route:<8}{before_rps:>14.1f}{after_rps:>14.1f}{after_rps / before_rps:>9.2f}x'
+              f'{before_opened:>20}{after_opened:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Latency of extract_title_from_url on large pages: the head-only single fetch
+versus the old download-everything-twice path.
+
+    python benchmarks/bench_extract.py --size 2000000 --requests 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import requests
+from bs4 import BeautifulSoup
+from newspaper import Article
+
+import url_scraper
+from stub_server import start_stub_server
+
+
+def legacy_extract_title(url, timeout=10):
+    """The pre-streaming implementation: newspaper3k download, then a second full GET."""
+    try:
+        article = Article(url, request_timeout=timeout)
+        article.download()
+        article.parse()
+        if article.title and article.title.strip():
+            return article.title.strip(), True
+    except Exception:
+        pass
+    response = requests.get(url, headers=url_scraper.HEADERS, timeout=timeout)
+    soup = BeautifulSoup(response.content, 'html.parser')
+    for tag in (soup.find('title'), soup.find('h1')):
+        if tag and tag.get_text().strip():
+            return tag.get_text().strip(), True
+    return None, False
+
+def measure(extract, base_url, size, count):
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        title, success = extract(f'{base_url}/page/{i}?size={size}')
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert success, title
+    latencies.sort()
+    return {'p50': statistics.median(latencies),
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=2000000, help='page size in bytes')
+    parser.add_argument('--requests', type=int, default=30)
+    args = parser.parse_args()
+
+    _, base_url = start_stub_server()
+    before = measure(legacy_extract_title, base_url, args.size, args.requests)
+    after = measure(url_scraper.extract_title_from_url, base_url, args.size, args.requests)
+
+    print(f"{'':<10}{'p50 ms':>10}{'p99 ms':>10}")
+    print(f"{'before':<10}{before['p50']:>10.1f}{before['p99']:>10.1f}")
+    print(f"{'after':<10}{after['p50']:>10.1f}{after['p99']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Bulk import throughput against local stub servers (one per simulated host).
+
+    python benchmarks/bench_import.py --links 5000 --hosts 20 --latency 0.2
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import database
+import importer
+import url_scraper
+from app import MEDIA_TYPES
+from stub_server import start_stub_server
+from url_cache import URLCache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--links', type=int, default=1000, help='URLs to import')
+    parser.add_argument('--hosts', type=int, default=10, help='stub servers to spread them over')
+    parser.add_argument('--latency', type=float, default=0.2, help='stub response latency in seconds')
+    parser.add_argument('--workers', type=int, default=importer.IMPORT_WORKERS)
+    parser.add_argument('--per-host', type=int, default=importer.PER_HOST_LIMIT)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    database.DATABASE = os.path.join(workdir, 'import.db')
+    database.init_db()
+    url_scraper.title_cache = URLCache(os.path.join(workdir, 'url_cache.db'))
+
+    base_urls = [start_stub_server(latency=args.latency)[1] for _ in range(args.hosts)]
+    text = '\n'.join(f'{base_urls[i % args.hosts]}/item/{i}' for i in range(args.links))
+
+    start = time.perf_counter()
+    ids, _ = importer.import_links(text, MEDIA_TYPES, workers=args.workers, per_host=args.per_host,
+                                   timeout=importer.FETCH_TIMEOUT)
+    elapsed = time.perf_counter() - start
+
+    serial = args.links * args.latency
+    print(f'imported {len(ids)} links in {elapsed:.1f}s ({len(ids) / elapsed:.1f} links/s); '
+          f'one-at-a-time would spend at least {serial:.0f}s in latency alone')
+
+
+if __name__ == '__main__':
+    main()
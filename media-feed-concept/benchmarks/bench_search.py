@@ -0,0 +1,77 @@
+"""
+FTS5 search_media() versus a LIKE '%term%' scan on a synthetic corpus.
+
+    python benchmarks/bench_search.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import database
+
+VOCABULARY = [f'w{i:05d}' for i in range(50000)]
+QUERIES = ['w00017', 'w04242', 'w31337 w00008', 'w49999', 'w123*']
+
+
+def seed(rows, batch=50000):
+    """Fill the media table with random text; the FTS triggers index it as it goes."""
+    rng = random.Random(42)
+    conn = database.get_connection()
+
+    def sentence(n):
+        return ' '.join(rng.choice(VOCABULARY) for _ in range(n))
+
+    for start in range(0, rows, batch):
+        with conn:
+            conn.executemany('''
+                INSERT INTO media (title, authors, media_type, rating, thoughts, url)
+                VALUES (?, ?, 'articles', ?, ?, NULL)
+            ''', [(sentence(6), sentence(2), rng.randint(1, 10), sentence(30))
+                  for _ in range(start, min(start + batch, rows))])
+
+def timed(fn, repeat):
+    """Best-of-`repeat` wall time of fn() in milliseconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def like_search(text, limit=database.FEED_PAGE_SIZE):
+    conn = database.get_connection()
+    clauses, params = [], []
+    for word in text.replace('*', '').split():
+        clauses.append('(title LIKE ? OR authors LIKE ? OR thoughts LIKE ?)')
+        params += [f'%{word}%'] * 3
+    return conn.execute(f'''
+        SELECT id FROM media WHERE {' AND '.join(clauses)} LIMIT ?
+    ''', params + [limit]).fetchall()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000, help='rows in the corpus')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per query (best is kept)')
+    args = parser.parse_args()
+
+    database.DATABASE = os.path.join(tempfile.mkdtemp(), 'search.db')
+    database.init_db()
+    start = time.perf_counter()
+    seed(args.rows)
+    print(f'seeded {args.rows} rows in {time.perf_counter() - start:.1f}s\n')
+
+    print(f"{'query':<20}{'fts5 ms':>10}{'like ms':>12}{'hits':>6}")
+    for query in QUERIES:
+        fts_ms = timed(lambda: database.search_media(query), args.repeat)
+        like_ms = timed(lambda: like_search(query), 1)
+        hits = len(database.search_media(query))
+        print(f'{query:<20}{fts_ms:>10.2f}{like_ms:>12.2f}{hits:>6}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+find_similar() latency on a synthetic corpus with a Zipf-like vocabulary.
+
+    python benchmarks/bench_similar.py --rows 100000 --lookups 500
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import database
+
+VOCABULARY = [f'w{i:05d}' for i in range(50000)]
+# Word i is drawn with weight 1/(i+1), so a few words are everywhere and most are rare
+CUMULATIVE = list(itertools.accumulate(1 / (i + 1) for i in range(len(VOCABULARY))))
+
+
+def rows(count, rng):
+    def sentence(n):
+        return ' '.join(rng.choices(VOCABULARY, cum_weights=CUMULATIVE, k=n))
+
+    for _ in range(count):
+        yield (sentence(6), sentence(2), 'articles', rng.randint(1, 10), sentence(30), None)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000, help='items in the corpus')
+    parser.add_argument('--lookups', type=int, default=500, help='random items to look up')
+    args = parser.parse_args()
+
+    database.DATABASE = os.path.join(tempfile.mkdtemp(), 'similar.db')
+    database.init_db()
+    rng = random.Random(42)
+
+    start = time.perf_counter()
+    ids = database.add_media_items(rows(args.rows, rng))
+    print(f'indexed {len(ids)} items in {time.perf_counter() - start:.1f}s')
+
+    timings = []
+    for media_id in rng.sample(ids, min(args.lookups, len(ids))):
+        start = time.perf_counter()
+        database.find_similar(media_id)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    cuts = statistics.quantiles(timings, n=100)
+    print(f'find_similar: p50 {cuts[49]:.2f} ms, p95 {cuts[94]:.2f} ms, p99 {cuts[98]:.2f} ms')
+
+    start = time.perf_counter()
+    database.delete_media_item(ids[0])
+    print(f'delete (with vector removal): {(time.perf_counter() - start) * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Startup time and requests/sec under gunicorn with 1 vs N worker processes sharing one SQLite file.
+
+    python benchmarks/bench_workers.py --rows 10000 --workers 1 4 --clients 8 --duration 10
+
+A throwaway database is seeded once, then for each worker count gunicorn is
+started with gunicorn.conf.py against that same file. Startup is the time
+from launching gunicorn until /feed first answers. Client processes then
+send a mix of feed pages, filtered pages, API pages and searches, plus
+--write-ratio /add posts, for --duration seconds.
+"""
+import argparse
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+import requests
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, APP_DIR)
+
+import database
+from app import MEDIA_TYPES
+
+STARTUP_TIMEOUT = 30  # seconds to wait for gunicorn to answer
+WORDS = ('garden', 'river', 'signal', 'harbor', 'lantern', 'meadow', 'circuit', 'orbit')
+
+
+def seed_rows(count):
+    rng = random.Random(7)
+    for i in range(count):
+        yield (f'Seed {rng.choice(WORDS)} {rng.choice(WORDS)} {i}', f'Author {i % 300}',
+               MEDIA_TYPES[i % len(MEDIA_TYPES)], i % 10 + 1, f'Seed thoughts about {rng.choice(WORDS)}',
+               f'https://example.com/seed/{i}')
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_server(path, workers, threads):
+    """Launch gunicorn on a free port; returns (process, base URL, startup seconds)."""
+    port = free_port()
+    env = dict(os.environ, DATABASE=path)
+    command = [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+               '--workers', str(workers), '--bind', f'127.0.0.1:{port}']
+    if threads:
+        command += ['--threads', str(threads)]
+    base = f'http://127.0.0.1:{port}'
+
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=APP_DIR, env=env, stderr=subprocess.DEVNULL)
+    while True:
+        try:
+            if requests.get(f'{base}/feed', timeout=1).status_code == 200:
+                return process, base, time.perf_counter() - start
+        except requests.ConnectionError:
+            pass
+        if process.poll() is not None or time.perf_counter() - start > STARTUP_TIMEOUT:
+            process.kill()
+            raise SystemExit(f'gunicorn with {workers} workers did not start')
+        time.sleep(0.01)
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    process.wait(timeout=STARTUP_TIMEOUT)
+
+def client(job):
+    """One client process: send requests until the deadline; returns (latencies, errors)."""
+    base, deadline, write_ratio, seed = job
+    rng = random.Random(seed)
+    session = requests.Session()
+    latencies = []
+    errors = 0
+    n = 0
+    while time.time() < deadline:
+        n += 1
+        start = time.perf_counter()
+        try:
+            if rng.random() < write_ratio:
+                form = {'title': f'Bench item {seed}-{n}', 'authors': 'Bench', 'media_type': 'books',
+                        'rating': '8', 'thoughts': 'Inserted by bench_workers', 'url': ''}
+                response = session.post(f'{base}/add', data=form, allow_redirects=False)
+                ok = response.status_code == 302
+            else:
+                path = rng.choice((
+                    '/feed',
+                    f'/feed?type={rng.choice(MEDIA_TYPES)}',
+                    f'/feed?min_rating={rng.randint(1, 10)}',
+                    f'/api/media?type={rng.choice(MEDIA_TYPES)}',
+                    f'/search?q={rng.choice(WORDS)}',
+                ))
+                ok = session.get(base + path).status_code == 200
+        except requests.RequestException:
+            ok = False
+        if ok:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors += 1
+    return latencies, errors
+
+def measure(base, args):
+    deadline = time.time() + args.duration
+    jobs = [(base, deadline, args.write_ratio, seed) for seed in range(args.clients)]
+    with Pool(args.clients) as pool:
+        results = pool.map(client, jobs)
+    latencies = sorted(latency for result in results for latency in result[0])
+    errors = sum(result[1] for result in results)
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) >= 2 else [0.0] * 99
+    return {'requests': len(latencies), 'errors': errors, 'rps': len(latencies) / args.duration,
+            'p50_ms': cuts[49] * 1000, 'p99_ms': cuts[98] * 1000}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000, help='rows seeded before measuring')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4], help='worker counts to compare')
+    parser.add_argument('--threads', type=int, help='threads per worker (default: gunicorn.conf.py)')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent client processes')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of load per worker count')
+    parser.add_argument('--write-ratio', type=float, default=0.05, help='share of requests that are /add posts')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'workers.db')
+    database.init_db(path)
+    database.DATABASE = path
+    database.add_media_items(seed_rows(args.rows))
+    database.close_connection()
+    print(f'{os.cpu_count()} CPUs, {args.rows} rows, {args.clients} clients', file=sys.stderr)
+
+    print(f"{'workers':>8}{'startup s':>11}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for workers in args.workers:
+        process, base, startup = start_server(path, workers, args.threads)
+        try:
+            result = measure(base, args)
+        finally:
+            stop_server(process)
+        print(f"{workers:>8}{startup:>11.2f}{result['rps']:>10.1f}{result['p50_ms']:>9.1f}"
+              f"{result['p99_ms']:>9.1f}{result['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""
+Load test: seed a throwaway database and drive the app over HTTP with concurrent clients.
+
+    python benchmarks/load_test.py --rows 10000 100000 1000000 --clients 8 --output before.json
+
+For each seed size a fresh database is filled with add_media_items and the
+app is served by werkzeug's threaded server. /feed, /add, /delete/<id> and
+/extract_title are then measured one after another. /feed requests walk
+the first --feed-pages pages of several filters in turn, with the page
+cache off, so every one renders its page from the database; an /extract_title
+request counts as done once its job has finished, fetching pages from a
+local stub server with --latency seconds of delay. Results (throughput plus
+p50/p95/p99 latency per route) are written as JSON so runs on different
+commits can be diffed.
+"""
+import argparse
+import http.cookiejar
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import database
+import url_scraper
+from app import create_app, feed_cache
+from stub_server import start_stub_server
+from url_cache import URLCache
+
+POLL_INTERVAL = 0.01  # seconds between /extract_title status polls
+# Filter combinations /feed is browsed with, as query-string values
+FEED_FILTERS = ({}, {'type': 'books'}, {'type': 'podcasts'}, {'min_rating': '8'},
+                {'type': 'articles', 'min_rating': '5'})
+
+
+def seed_rows(count):
+    media_types = ('books', 'podcasts', 'articles', 'websites', 'tweets')
+    for i in range(count):
+        yield (f'Seed item {i}', f'Author {i % 500}', media_types[i % len(media_types)],
+               i % 10 + 1, f'Seed thoughts {i}', f'https://example.com/seed/{i}')
+
+def new_client():
+    """An HTTP session that keeps its connection but drops cookies, so flashes don't pile up."""
+    client = requests.Session()
+    client.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    return client
+
+def feed_urls(base, pages):
+    """
+    Paths for the first `pages` pages of the feed under each of FEED_FILTERS,
+    following the same cursors as the feed's own next links (via /api/media).
+    """
+    client = new_client()
+    urls = []
+    for filters in FEED_FILTERS:
+        after = None
+        for _ in range(pages):
+            params = dict(filters, after=after) if after else filters
+            urls.append(requests.Request('GET', f'{base}/feed', params=params).prepare().url)
+            after = client.get(f'{base}/api/media', params=params).json()['next']
+            if after is None:
+                break
+    return urls
+
+def summarize(latencies, errors, elapsed):
+    """Throughput and latency percentiles (in milliseconds) for one route."""
+    result = {'requests': len(latencies), 'errors': errors,
+              'throughput': round(len(latencies) / elapsed, 2) if elapsed else 0.0}
+    if len(latencies) >= 2:
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        result.update({
+            'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+            'p50_ms': round(cuts[49] * 1000, 3),
+            'p95_ms': round(cuts[94] * 1000, 3),
+            'p99_ms': round(cuts[98] * 1000, 3),
+            'max_ms': round(max(latencies) * 1000, 3),
+        })
+    return result
+
+def drive(request, total, clients):
+    """
+    Call request(client, n) for n in range(total) from `clients` threads, each
+    with its own HTTP session. request returns True on success.
+    """
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies = []
+    errors = [0]
+
+    def worker(_):
+        client = new_client()
+        while True:
+            with lock:
+                n = next(counter)
+            if n >= total:
+                return
+            start = time.perf_counter()
+            try:
+                ok = request(client, n)
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(worker, range(clients)))
+    return summarize(latencies, errors[0], time.perf_counter() - start)
+
+def run(rows, args, stub_url):
+    workdir = tempfile.mkdtemp()
+    database.DATABASE = os.path.join(workdir, 'load.db')
+    app = create_app()
+    # Render /feed on every request, so it measures the data layer and not the page cache
+    feed_cache.max_entries = 0
+    url_scraper.title_cache = URLCache(os.path.join(workdir, 'url_cache.db'))
+
+    start = time.perf_counter()
+    ids = database.add_media_items(seed_rows(rows))
+    seed_seconds = time.perf_counter() - start
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+
+    pages = feed_urls(base, args.feed_pages)
+
+    def feed(client, n):
+        return client.get(pages[n % len(pages)]).status_code == 200
+
+    def add(client, n):
+        form = {'title': f'Load item {n}', 'authors': 'Load test', 'media_type': 'books',
+                'rating': '8', 'thoughts': 'Inserted by the load test', 'url': ''}
+        return client.post(f'{base}/add', data=form, allow_redirects=False).status_code == 302
+
+    # Delete the newest seeded rows, one distinct id per request
+    doomed = ids[::-1]
+
+    def delete(client, n):
+        response = client.post(f'{base}/delete/{doomed[n]}', allow_redirects=False)
+        return response.status_code == 302
+
+    def extract(client, n):
+        # A fresh URL per request, so every one is a cache miss and a real fetch
+        response = client.post(f'{base}/extract_title', json={'url': f'{stub_url}/load/{rows}/{n}'})
+        body = response.json()
+        while body.get('status') in ('queued', 'running'):
+            time.sleep(POLL_INTERVAL)
+            body = client.get(f"{base}{body['status_url']}").json()
+        return body.get('success', False)
+
+    results = {}
+    try:
+        for route, request in (('/feed', feed), ('/add', add), ('/delete/<id>', delete),
+                               ('/extract_title', extract)):
+            total = min(args.requests, len(doomed)) if request is delete else args.requests
+            print(f'  {rows} rows: {route}', file=sys.stderr)
+            results[route] = drive(request, total, args.clients)
+    finally:
+        server.shutdown()
+        database.close_connection()
+
+    return {'seed_seconds': round(seed_seconds, 2), 'routes': results}
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000],
+                        help='seed sizes to test, each against a fresh database')
+    parser.add_argument('--requests', type=int, default=500, help='requests per route')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--feed-pages', type=int, default=20,
+                        help='how deep /feed requests page under each filter')
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='stub server latency in seconds for /extract_title')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub_server(latency=args.latency)
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'sqlite': database.sqlite3.sqlite_version,
+        'requests_per_route': args.requests,
+        'clients': args.clients,
+        'feed_pages': args.feed_pages,
+        'stub_latency': args.latency,
+        'runs': {},
+    }
+    try:
+        for rows in args.rows:
+            report['runs'][str(rows)] = run(rows, args, stub_url)
+    finally:
+        stub.shutdown()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
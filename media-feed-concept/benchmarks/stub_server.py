@@ -0,0 +1,79 @@
+"""
+Local stand-in web server for benchmarks, so scraping code can be exercised
+without touching the network.
+
+    python benchmarks/stub_server.py --port 8099 --latency 0.2
+
+Every GET returns a small HTML page titled after its path, after sleeping
+`latency` seconds (or ?delay=<seconds>). Paths under /notitle/ have no
+<title>, and ?size=<bytes> pads the body to exercise large pages.
+"""
+import argparse
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        time.sleep(float(query.get('delay', [self.latency])[0]))
+
+        title = '' if parts.path.startswith('/notitle/') else f'<title>Stub page {parts.path}</title>'
+        body = (f'<!DOCTYPE html><html><head><meta charset="utf-8">{title}</head>'
+                f'<body><h1>Heading {parts.path}</h1>')
+        padding = int(query.get('size', [0])[0]) - len(body)
+        if padding > 0:
+            body += '<p>' + 'x' * padding + '</p>'
+        body = (body + '</body></html>').encode()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up early (e.g. after reading just the <head>) is expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_stub_server(port=0, latency=0.0):
+    """Start a stub server on a daemon thread; returns (server, base_url)."""
+    handler = type('Handler', (StubHandler,), {'latency': latency})
+    server = StubServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to wait before answering')
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.port, args.latency)
+    print(f'Serving stub pages at {base_url} (Ctrl+C to stop)')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,80 +1,1207 @@
+import re
 import sqlite3
+import threading
+import time
+from collections import Counter
+from itertools import islice
 from datetime import datetime
 import os
 
-DATABASE = 'media_feed.db'
+from metrics import observe_sql, observe_sql_fetch
+from similarity import vectorize, vector_norm, query_weights, SIMILAR_LIMIT
+from urls import normalize_url
 
-def init_db():
-    """Initialize the database with the media table."""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS media (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            authors TEXT,
-            media_type TEXT NOT NULL,
-            rating INTEGER CHECK(rating >= 1 AND rating <= 10),
-            thoughts TEXT,
-            url TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
+DATABASE = os.environ.get('DATABASE', 'media_feed.db')
+
+# Tuning applied to every connection we open. WAL lets readers and the writer
+# work at the same time, and NORMAL sync is safe under WAL.
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -20000',  # ~20 MB page cache
+    'PRAGMA temp_store = MEMORY',
+)
+BUSY_TIMEOUT = 5.0  # seconds to wait on a locked database
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))  # idle connections kept for reuse per process
+STATEMENT_CACHE_SIZE = 256  # prepared statements kept per connection
+
+FEED_PAGE_SIZE = 30
+EXPORT_BATCH_SIZE = 1000  # rows fetched per step when streaming the whole table
+PAGE_FETCH_SIZE = 10  # rows MediaPage fetches per step, so the first ones render early
+INSERT_CHUNK_SIZE = 5000  # rows per executemany call in add_media_items
+# Per-row AFTER INSERT triggers that add_media_items replaces with per-chunk statements
+BULK_INSERT_TRIGGERS = ('media_fts_insert', 'media_stats_insert', 'media_changes_insert')
+# Smaller batches keep the triggers: dropping them changes the schema, which
+# makes every pooled connection re-prepare its cached statements
+BULK_INSERT_MIN_ROWS = 500
+URL_LOOKUP_BATCH = 500  # canonical URLs per IN (...) query in find_existing_urls
+JOB_STALE_AFTER = 5 * 60  # a running job untouched this long is assumed dead
+JOB_KEEP_FOR = 24 * 60 * 60  # finished jobs are pruned after a day
+
+MEDIA_COLUMNS = ('id', 'title', 'authors', 'media_type', 'rating', 'thoughts', 'url', 'created_at')
+CARD_COLUMNS = MEDIA_COLUMNS + ('image_key',)  # what a feed card shows
+
+_local = threading.local()
+
+# Metric label for each SQL string seen, e.g. "SELECT media" or "INSERT extraction_jobs"
+_statement_labels = {}
+_STATEMENT_TABLE = re.compile(
+    r'\b(?:FROM|INTO|UPDATE|(?:TABLE|INDEX|TRIGGER)(?:\s+IF\s+NOT\s+EXISTS)?)\s+(\w+)', re.IGNORECASE)
+
+def _statement_label(sql):
+    label = _statement_labels.get(sql)
+    if label is None:
+        words = sql.split(None, 1)
+        verb = words[0].upper() if words else ''
+        table = _STATEMENT_TABLE.search(sql)
+        label = f'{verb} {table.group(1)}' if table and verb != 'PRAGMA' else verb
+        _statement_labels[sql] = label
+    return label
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor that reports the time spent executing and fetching each statement
+    to metrics. A statement is counted once, when it is executed; the time
+    its fetches take is added to it.
+    """
+
+    _label = None
+
+    def _timed(self, observe, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            observe(self._label, time.perf_counter() - start)
+
+    def execute(self, sql, parameters=()):
+        self._label = _statement_label(sql)
+        return self._timed(observe_sql, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._label = _statement_label(sql)
+        return self._timed(observe_sql, super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        return self._timed(observe_sql_fetch, super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed(observe_sql_fetch, super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._timed(observe_sql_fetch, super().fetchall)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose shortcut execute methods go through InstrumentedCursor."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def connect(path=None):
+    """
+    Open a new tuned connection to `path` (default: DATABASE). The caller
+    closes it. It may move between threads (the pool hands it to one thread
+    at a time), so sqlite3's same-thread check is off.
+    """
+    conn = sqlite3.connect(path or DATABASE, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE, factory=InstrumentedConnection)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+class ConnectionPool:
+    """
+    Tuned connections shared between threads. A thread checks one out with
+    get_connection() and gives it back with release_connection(), which the
+    app does when each request's app context ends, so a threaded server that
+    starts a new thread per request still reuses connections. At most `size`
+    idle connections are kept; busier moments open extra ones, which are
+    closed when they come back.
+    """
+
+    def __init__(self, size=POOL_SIZE):
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+        # Connections a forked worker inherited from its parent. They are never
+        # used or closed in the child (SQLite connections must not cross a
+        # fork); holding them here keeps garbage collection from closing them either.
+        self._inherited = []
+
+    def acquire(self):
+        key = (DATABASE, os.getpid())
+        with self._lock:
+            while self._idle:
+                conn = self._idle.pop()
+                if conn.pool_key == key:
+                    return conn
+                self._discard(conn)
+        conn = connect()
+        conn.pool_key = key
+        return conn
+
+    def release(self, conn):
+        if conn.pool_key[1] == os.getpid() and conn.in_transaction:
+            conn.rollback()  # whatever the request left unfinished
+        with self._lock:
+            if conn.pool_key == (DATABASE, os.getpid()) and len(self._idle) < self.size:
+                self._idle.append(conn)
+            else:
+                self._discard(conn)
+
+    def _discard(self, conn):
+        if conn.pool_key[1] != os.getpid():
+            self._inherited.append(conn)
+        else:
+            conn.close()
+
+    def clear(self):
+        """Close every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            for conn in idle:
+                self._discard(conn)
+
+pool = ConnectionPool()
+
+def get_connection():
+    """Return the connection this thread has checked out of the pool, checking one out if needed."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and conn.pool_key == (DATABASE, os.getpid()):
+        return conn
+    if conn is not None:
+        # The database path changed, or a WSGI worker forked after this thread connected
+        pool.release(conn)
+    conn = _local.conn = pool.acquire()
+    return conn
+
+def release_connection(exception=None):
+    """Give this thread's connection back to the pool, if it has one."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        _local.conn = None
+        pool.release(conn)
+
+def close_connection(exception=None):
+    """Release this thread's connection and close every idle one."""
+    release_connection()
+    pool.clear()
+
+def init_db(path=None):
+    """
+    Create or upgrade the schema: the app's database through this thread's
+    connection, or the database at `path` through a throwaway one.
+    """
+    if path is None:
+        _create_schema(get_connection())
+        return
+
+    conn = connect(path)
+    try:
+        _create_schema(conn)
+    finally:
+        conn.close()
+
+def _create_schema(conn):
+    with conn:
+        # Take the write lock up front: every worker of a multi-process server
+        # runs this at startup, and the checks below must not interleave
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS media (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                authors TEXT,
+                media_type TEXT NOT NULL,
+                rating INTEGER CHECK(rating >= 1 AND rating <= 10),
+                thoughts TEXT,
+                url TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        # Serves the feed's ORDER BY and the (created_at, id) page cursor
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_media_created_at
+            ON media (created_at DESC, id DESC)
+        ''')
+        # The same order within one media type, for the feed's type filter.
+        # Carrying rating lets the rating filter and date-range facet counts
+        # be answered from the index alone.
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_media_type_created_at
+            ON media (media_type, created_at DESC, id DESC, rating)
+        ''')
+        # Facet counts by rating: per type, a range of ratings, then dates
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_media_type_rating_created_at
+            ON media (media_type, rating, created_at)
+        ''')
+
+        # The url in canonical form (see urls.normalize_url), indexed so that
+        # duplicate checks are a single index lookup
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(media)')}
+        if 'canonical_url' not in columns:
+            conn.execute('ALTER TABLE media ADD COLUMN canonical_url TEXT')
+            rows = conn.execute(
+                "SELECT id, url FROM media WHERE url IS NOT NULL AND url != ''").fetchall()
+            conn.executemany('UPDATE media SET canonical_url = ? WHERE id = ?',
+                             [(normalize_url(url), item_id) for item_id, url in rows])
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_media_canonical_url
+            ON media (canonical_url) WHERE canonical_url IS NOT NULL
+        ''')
+
+        # The page's preview image (og:image) and the key of its local
+        # thumbnails, which is filled in once they have been made
+        if 'image_url' not in columns:
+            conn.execute('ALTER TABLE media ADD COLUMN image_url TEXT')
+            conn.execute('ALTER TABLE media ADD COLUMN image_key TEXT')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_media_image_url
+            ON media (image_url) WHERE image_url IS NOT NULL
+        ''')
+
+        # Full-text index over the searchable columns. It stores no text of its
+        # own (content='media') and the triggers below keep it in sync.
+        fts_exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'media_fts'"
+        ).fetchone()
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS media_fts USING fts5(
+                title, authors, thoughts,
+                content='media', content_rowid='id'
+            )
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS media_fts_insert AFTER INSERT ON media BEGIN
+                INSERT INTO media_fts (rowid, title, authors, thoughts)
+                VALUES (new.id, new.title, new.authors, new.thoughts);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS media_fts_delete AFTER DELETE ON media BEGIN
+                INSERT INTO media_fts (media_fts, rowid, title, authors, thoughts)
+                VALUES ('delete', old.id, old.title, old.authors, old.thoughts);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS media_fts_update
+            AFTER UPDATE OF title, authors, thoughts ON media BEGIN
+                INSERT INTO media_fts (media_fts, rowid, title, authors, thoughts)
+                VALUES ('delete', old.id, old.title, old.authors, old.thoughts);
+                INSERT INTO media_fts (rowid, title, authors, thoughts)
+                VALUES (new.id, new.title, new.authors, new.thoughts);
+            END
+        ''')
+        if not fts_exists:
+            # Index rows written before full-text search existed
+            conn.execute("INSERT INTO media_fts (media_fts) VALUES ('rebuild')")
+
+        # A single row counting writes to media, so caches can tell when the
+        # feed changed without looking at the table itself
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS data_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('INSERT OR IGNORE INTO data_version (id, version, updated_at) VALUES (1, 0, ?)',
+                     (time.time(),))
+
+        # Title extraction jobs run by jobs.py. The partial unique index allows
+        # one queued/running job per URL, which is what collapses duplicates.
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS extraction_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued'
+                    CHECK(status IN ('queued', 'running', 'done', 'failed')),
+                title TEXT,
+                media_type TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_extraction_jobs_active
+            ON extraction_jobs (url) WHERE status IN ('queued', 'running')
+        ''')
+
+        # Running totals per (media_type, rating, month) for /stats, kept up
+        # to date by triggers so reading them never touches media itself.
+        # Unrated items count under rating 0.
+        stats_exist = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'media_stats'"
+        ).fetchone()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS media_stats (
+                media_type TEXT NOT NULL,
+                rating INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                item_count INTEGER NOT NULL,
+                PRIMARY KEY (media_type, rating, month)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS media_stats_insert AFTER INSERT ON media BEGIN
+                INSERT INTO media_stats (media_type, rating, month, item_count)
+                VALUES (new.media_type, COALESCE(new.rating, 0),
+                        COALESCE(strftime('%Y-%m', new.created_at), ''), 1)
+                ON CONFLICT (media_type, rating, month) DO UPDATE SET item_count = item_count + 1;
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS media_stats_delete AFTER DELETE ON media BEGIN
+                UPDATE media_stats SET item_count = item_count - 1
+                WHERE media_type = old.media_type AND rating = COALESCE(old.rating, 0)
+                  AND month = COALESCE(strftime('%Y-%m', old.created_at), '');
+                DELETE FROM media_stats
+                WHERE media_type = old.media_type AND rating = COALESCE(old.rating, 0)
+                  AND month = COALESCE(strftime('%Y-%m', old.created_at), '') AND item_count <= 0;
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS media_stats_update
+            AFTER UPDATE OF media_type, rating, created_at ON media BEGIN
+                UPDATE media_stats SET item_count = item_count - 1
+                WHERE media_type = old.media_type AND rating = COALESCE(old.rating, 0)
+                  AND month = COALESCE(strftime('%Y-%m', old.created_at), '');
+                DELETE FROM media_stats
+                WHERE media_type = old.media_type AND rating = COALESCE(old.rating, 0)
+                  AND month = COALESCE(strftime('%Y-%m', old.created_at), '') AND item_count <= 0;
+                INSERT INTO media_stats (media_type, rating, month, item_count)
+                VALUES (new.media_type, COALESCE(new.rating, 0),
+                        COALESCE(strftime('%Y-%m', new.created_at), ''), 1)
+                ON CONFLICT (media_type, rating, month) DO UPDATE SET item_count = item_count + 1;
+            END
+        ''')
+        if not stats_exist:
+            _rebuild_stats(conn)
+
+        # Hashed term vectors for "similar items" (see similarity.py), kept
+        # current by the write functions below: postings per (term, item),
+        # document frequency per term and each item's vector norm
+        vectors_exist = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'media_vectors'"
+        ).fetchone()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS media_terms (
+                term INTEGER NOT NULL,
+                media_id INTEGER NOT NULL,
+                weight REAL NOT NULL,
+                PRIMARY KEY (term, media_id)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_media_terms_media ON media_terms (media_id)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS term_df (
+                term INTEGER PRIMARY KEY,
+                df INTEGER NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS media_vectors (
+                media_id INTEGER PRIMARY KEY,
+                norm REAL NOT NULL
+            )
+        ''')
+        # A single row counting media_vectors, so lookups get the number of
+        # indexed items without counting the table
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS vector_count (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                items INTEGER NOT NULL
+            )
+        ''')
+        conn.execute('''
+            INSERT OR IGNORE INTO vector_count (id, items) SELECT 1, COUNT(*) FROM media_vectors
+        ''')
+        if not vectors_exist:
+            _rebuild_similarity(conn)
+
+        # Log of which media rows changed, for incremental snapshots (see
+        # backup.py). Entries are pruned once a snapshot has covered them.
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS media_changes (
+                change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                media_id INTEGER NOT NULL
+            )
+        ''')
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            row = 'old' if event == 'DELETE' else 'new'
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS media_changes_{event.lower()} AFTER {event} ON media BEGIN
+                    INSERT INTO media_changes (media_id) VALUES ({row}.id);
+                END
+            ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL CHECK(kind IN ('full', 'incremental')),
+                base_change_id INTEGER NOT NULL,
+                last_change_id INTEGER NOT NULL,
+                filename TEXT NOT NULL,
+                rows INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        ''')
+
+        # Which preview image URLs have thumbnails on disk (see thumbnails.py),
+        # so each image is downloaded once however many items share it
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS thumbnails (
+                image_url TEXT PRIMARY KEY,
+                image_key TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        ''')
+
+def _rebuild_stats(conn):
+    """Recompute media_stats from scratch; call inside a transaction."""
+    conn.execute('DELETE FROM media_stats')
+    conn.execute('''
+        INSERT INTO media_stats (media_type, rating, month, item_count)
+        SELECT media_type, COALESCE(rating, 0), COALESCE(strftime('%Y-%m', created_at), ''), COUNT(*)
+        FROM media
+        GROUP BY 1, 2, 3
     ''')
-    
-    conn.commit()
-    conn.close()
 
-def add_media_item(title, authors, media_type, rating, thoughts, url=None):
-    """Add a new media item to the database."""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        INSERT INTO media (title, authors, media_type, rating, thoughts, url)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (title, authors, media_type, rating, thoughts, url))
-    
-    conn.commit()
-    conn.close()
+def rebuild_stats():
+    """Recompute the summary table from the media table (e.g. after a manual import)."""
+    conn = get_connection()
+    with conn:
+        _rebuild_stats(conn)
+
+def _index_media(conn, items):
+    """Add term vectors for (media_id, title, authors, thoughts) items; call inside a transaction."""
+    postings = []
+    norms = []
+    df = Counter()
+    for media_id, title, authors, thoughts in items:
+        vector = vectorize(title, authors, thoughts)
+        postings.extend((term, media_id, weight) for term, weight in vector.items())
+        norms.append((media_id, vector_norm(vector)))
+        df.update(vector.keys())
+
+    conn.executemany('INSERT INTO media_terms (term, media_id, weight) VALUES (?, ?, ?)', postings)
+    conn.executemany('INSERT INTO media_vectors (media_id, norm) VALUES (?, ?)', norms)
+    conn.execute('UPDATE vector_count SET items = items + ? WHERE id = 1', (len(norms),))
+    conn.executemany('''
+        INSERT INTO term_df (term, df) VALUES (?, ?)
+        ON CONFLICT (term) DO UPDATE SET df = df + excluded.df
+    ''', df.items())
+
+def _unindex_media(conn, media_id):
+    """Drop an item's term vector; call inside a transaction."""
+    # Only the item's own terms can have dropped to zero, so only they are checked
+    conn.execute('''
+        UPDATE term_df SET df = df - 1
+        WHERE term IN (SELECT term FROM media_terms WHERE media_id = ?)
+    ''', (media_id,))
+    conn.execute('''
+        DELETE FROM term_df
+        WHERE df <= 0 AND term IN (SELECT term FROM media_terms WHERE media_id = ?)
+    ''', (media_id,))
+    conn.execute('DELETE FROM media_terms WHERE media_id = ?', (media_id,))
+    removed = conn.execute('DELETE FROM media_vectors WHERE media_id = ?', (media_id,)).rowcount
+    conn.execute('UPDATE vector_count SET items = items - ? WHERE id = 1', (removed,))
+
+def _rebuild_similarity(conn):
+    """Recompute every term vector from the media table; call inside a transaction."""
+    conn.execute('DELETE FROM media_terms')
+    conn.execute('DELETE FROM term_df')
+    conn.execute('DELETE FROM media_vectors')
+    conn.execute('UPDATE vector_count SET items = 0 WHERE id = 1')
+    cursor = conn.execute('SELECT id, title, authors, thoughts FROM media')
+    while True:
+        items = cursor.fetchmany(INSERT_CHUNK_SIZE)
+        if not items:
+            break
+        _index_media(conn, items)
+
+def rebuild_similarity(conn=None):
+    """
+    Recompute the similar-items vectors from the media table, in the app's
+    database or in the one behind `conn` (e.g. a restore target).
+    """
+    if conn is None:
+        conn = get_connection()
+    with conn:
+        _rebuild_similarity(conn)
+
+def _bump_data_version(conn):
+    """Record a change to media; call inside the transaction that made it."""
+    conn.execute('UPDATE data_version SET version = version + 1, updated_at = ? WHERE id = 1',
+                 (time.time(),))
+
+def get_data_version():
+    """
+    Return tuple: (version, updated_at) where version increases with every
+    write to media and updated_at is the unix time of the latest one.
+    """
+    conn = get_connection()
+    return conn.execute('SELECT version, updated_at FROM data_version WHERE id = 1').fetchone()
+
+def add_media_item(title, authors, media_type, rating, thoughts, url=None, image_url=None):
+    """
+    Add a new media item to the database. `image_url` is the page's preview
+    image; the item shows its thumbnails as soon as they exist.
+    """
+    conn = get_connection()
+
+    with conn:
+        cursor = conn.execute('''
+            INSERT INTO media (title, authors, media_type, rating, thoughts, url, canonical_url,
+                               image_url, image_key)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, (SELECT image_key FROM thumbnails WHERE image_url = ?))
+        ''', (title, authors, media_type, rating, thoughts, url, normalize_url(url),
+              image_url, image_url))
+        _index_media(conn, [(cursor.lastrowid, title, authors, thoughts)])
+        _bump_data_version(conn)
+
     return cursor.lastrowid
 
+def _after_bulk_insert(conn, first_id, last_id):
+    """
+    What the triggers in BULK_INSERT_TRIGGERS do per row, for the rows with
+    ids first_id..last_id at once; call inside add_media_items' transaction.
+    """
+    span = (first_id, last_id)
+    conn.execute('''
+        INSERT INTO media_fts (rowid, title, authors, thoughts)
+        SELECT id, title, authors, thoughts FROM media WHERE id BETWEEN ? AND ?
+    ''', span)
+    conn.execute('''
+        INSERT INTO media_stats (media_type, rating, month, item_count)
+        SELECT media_type, COALESCE(rating, 0), COALESCE(strftime('%Y-%m', created_at), ''), COUNT(*)
+        FROM media
+        WHERE id BETWEEN ? AND ?
+        GROUP BY 1, 2, 3
+        ON CONFLICT (media_type, rating, month) DO UPDATE SET item_count = item_count + excluded.item_count
+    ''', span)
+    conn.execute('''
+        INSERT INTO media_changes (media_id) SELECT id FROM media WHERE id BETWEEN ? AND ?
+    ''', span)
+
+def add_media_items(items, chunk_size=INSERT_CHUNK_SIZE):
+    """
+    Add many media items in a single transaction.
+    `items` yields (title, authors, media_type, rating, thoughts, url) tuples,
+    optionally followed by an image_url as in add_media_item, and is consumed
+    `chunk_size` rows at a time, each chunk going to SQLite in one
+    executemany call. For batches of BULK_INSERT_MIN_ROWS or more, the
+    per-row insert triggers are set aside for the transaction and their work
+    done once per chunk instead.
+    Returns the list of new IDs, in order.
+    """
+    conn = get_connection()
+    items = iter(items)
+
+    def next_chunk():
+        chunk = []
+        for item in islice(items, chunk_size):
+            image_url = item[6] if len(item) > 6 else None
+            chunk.append((*item[:6], normalize_url(item[5]), image_url, image_url))
+        return chunk
+
+    chunk = next_chunk()
+    if not chunk:
+        return []
+
+    # A full first chunk may be followed by any number of rows
+    bulk = len(chunk) >= min(BULK_INSERT_MIN_ROWS, chunk_size)
+
+    ids = []
+    triggers = []
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        if bulk:
+            # Dropped and recreated inside the transaction, so no other connection
+            # ever sees the table without them, and a rollback restores them
+            placeholders = ', '.join('?' * len(BULK_INSERT_TRIGGERS))
+            triggers = conn.execute(f'''
+                SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN ({placeholders})
+            ''', BULK_INSERT_TRIGGERS).fetchall()
+            for name, _ in triggers:
+                conn.execute(f'DROP TRIGGER {name}')
+
+        while chunk:
+            conn.executemany('''
+                INSERT INTO media (title, authors, media_type, rating, thoughts, url, canonical_url,
+                                   image_url, image_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, (SELECT image_key FROM thumbnails WHERE image_url = ?))
+            ''', chunk)
+            # We hold the write lock for the whole transaction, so the chunk's
+            # rowids are the consecutive ones ending at the last insert
+            last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+            chunk_ids = range(last_id - len(chunk) + 1, last_id + 1)
+            if bulk:
+                _after_bulk_insert(conn, chunk_ids[0], last_id)
+            _index_media(conn, [(media_id, item[0], item[1], item[4])
+                                for media_id, item in zip(chunk_ids, chunk)])
+            ids.extend(chunk_ids)
+            chunk = next_chunk()
+
+        for _, sql in triggers:
+            conn.execute(sql)
+        _bump_data_version(conn)
+
+    return ids
+
+def find_media_by_url(url):
+    """Return the oldest media item whose URL is the same link as `url` (after normalization), or None."""
+    canonical = normalize_url(url)
+    if canonical is None:
+        return None
+
+    conn = get_connection()
+    item = conn.execute('''
+        SELECT id, title, authors, media_type, rating, thoughts, url, created_at
+        FROM media
+        WHERE canonical_url = ?
+        ORDER BY id
+        LIMIT 1
+    ''', (canonical,)).fetchone()
+    return dict(zip(MEDIA_COLUMNS, item)) if item else None
+
+def find_existing_urls(urls):
+    """Return the set of canonical forms of `urls` that are already in the media table."""
+    canonical = list({c for c in map(normalize_url, urls) if c is not None})
+    conn = get_connection()
+
+    existing = set()
+    for start in range(0, len(canonical), URL_LOOKUP_BATCH):
+        batch = canonical[start:start + URL_LOOKUP_BATCH]
+        placeholders = ', '.join('?' * len(batch))
+        existing.update(row[0] for row in conn.execute(
+            f'SELECT canonical_url FROM media WHERE canonical_url IN ({placeholders})', batch))
+    return existing
+
 def get_all_media():
     """Retrieve all media items ordered by creation date (newest first)."""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
+    conn = get_connection()
+
+    items = conn.execute('''
         SELECT id, title, authors, media_type, rating, thoughts, url, created_at
-        FROM media 
-        ORDER BY created_at DESC
-    ''')
-    
-    items = cursor.fetchall()
-    conn.close()
-    
+        FROM media
+        ORDER BY created_at DESC, id DESC
+    ''').fetchall()
+
     # Convert to list of dictionaries for easier template handling
-    media_items = []
-    for item in items:
-        media_items.append({
-            'id': item[0],
-            'title': item[1],
-            'authors': item[2],
-            'media_type': item[3],
-            'rating': item[4],
-            'thoughts': item[5],
-            'url': item[6],
-            'created_at': item[7]
-        })
-    
-    return media_items
+    return [dict(zip(MEDIA_COLUMNS, item)) for item in items]
+
+def _filter_clauses(media_type=None, min_rating=None, since=None, until=None, rating_index=True):
+    """
+    WHERE clauses and parameters for the feed filters. `since` and `until`
+    are inclusive 'YYYY-MM-DD' dates. With rating_index=False the rating test
+    is written as +rating, which stops SQLite from choosing the rating index
+    (and then sorting) when walking an index in feed order is cheaper.
+    """
+    clauses = []
+    params = []
+    if media_type is not None:
+        clauses.append('media_type = ?')
+        params.append(media_type)
+    if min_rating is not None:
+        clauses.append('rating >= ?' if rating_index else '+rating >= ?')
+        params.append(min_rating)
+    if since is not None:
+        clauses.append('created_at >= ?')
+        params.append(since)
+    if until is not None:
+        clauses.append("created_at < date(?, '+1 day')")
+        params.append(until)
+    return clauses, params
+
+def build_page_query(after=None, limit=FEED_PAGE_SIZE, **filters):
+    """
+    SQL and parameters for one feed page (limit + 1 rows, see MediaPage).
+    Seeks straight to the cursor position in idx_media_created_at, or in
+    idx_media_type_created_at when filtering by type, instead of OFFSET-ing,
+    so every page costs the same however deep it is.
+    """
+    clauses, params = _filter_clauses(rating_index=False, **filters)
+    if after is not None:
+        clauses.append('(created_at, id) < (?, ?)')
+        params.extend(after)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    sql = f'''
+        SELECT id, title, authors, media_type, rating, thoughts, url, created_at, image_key
+        FROM media
+        {where}
+        ORDER BY created_at DESC, id DESC
+        LIMIT ?
+    '''
+    return sql, params + [limit + 1]
+
+class MediaPage:
+    """
+    One page of media items, newest first, read lazily: iterating runs the
+    query and yields sqlite3.Row objects PAGE_FETCH_SIZE at a time (through
+    fetchmany, so the metrics see the time spent stepping the query), so
+    nothing is materialized up front. `after` is the (created_at, id) of the
+    last item on the previous page; `filters` are media_type, min_rating,
+    since and until. Once iteration has finished, next_cursor is the `after`
+    for the following page, or None on the last page.
+    """
+
+    def __init__(self, after=None, limit=FEED_PAGE_SIZE, **filters):
+        self.after = after
+        self.limit = limit
+        self.filters = filters
+        self.next_cursor = None
+
+    def __iter__(self):
+        cursor = get_connection().cursor()
+        cursor.row_factory = sqlite3.Row
+        # One extra row tells us whether another page exists
+        cursor.execute(*build_page_query(self.after, self.limit, **self.filters))
+
+        self.next_cursor = None
+        try:
+            last = None
+            count = 0
+            while True:
+                rows = cursor.fetchmany(PAGE_FETCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    if count == self.limit:
+                        self.next_cursor = (last['created_at'], last['id'])
+                        return
+                    count += 1
+                    last = row
+                    yield row
+        finally:
+            cursor.close()
+
+def get_media_page(after=None, limit=FEED_PAGE_SIZE, **filters):
+    """
+    Retrieve one page of media items, newest first, as dicts.
+    `after` is the (created_at, id) of the last item on the previous page;
+    `filters` are as for MediaPage.
+    Returns tuple: (items, next_cursor) where next_cursor is None on the last page.
+    """
+    page = MediaPage(after, limit, **filters)
+    media_items = [dict(row) for row in page]
+    return media_items, page.next_cursor
+
+def iter_all_media(batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yield every media item as a dict, newest first, stepping through the
+    table a batch at a time so memory use does not grow with its size.
+    Borrows its own connection from the pool: under WAL a long read does not
+    block writers, and this thread's connection stays free while the export
+    is in flight.
+    """
+    conn = pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            SELECT id, title, authors, media_type, rating, thoughts, url, created_at
+            FROM media
+            ORDER BY created_at DESC, id DESC
+        ''')
+        while True:
+            items = cursor.fetchmany(batch_size)
+            if not items:
+                break
+            for item in items:
+                yield dict(zip(MEDIA_COLUMNS, item))
+    finally:
+        # An export abandoned part way must not leave a read open on a pooled connection
+        cursor.close()
+        pool.release(conn)
+
+def build_search_query(text):
+    """
+    Turn free text from the search box into an FTS5 MATCH expression.
+    Every word must appear; a trailing * (e.g. "gats*") matches as a prefix.
+    Returns None for empty input.
+    """
+    words = re.findall(r'(\w+)(\*?)', text or '')
+    if not words:
+        return None
+
+    # Quote each word so FTS5 operators (AND, NEAR, ...) are taken literally
+    return ' '.join(f'"{word}"{star}' for word, star in words)
+
+def search_media(text, limit=FEED_PAGE_SIZE):
+    """Full-text search over title, authors and thoughts, best matches first."""
+    query = build_search_query(text)
+    if query is None:
+        return []
+
+    conn = get_connection()
+
+    # bm25 weights: a hit in the title counts most, then authors, then thoughts
+    items = conn.execute('''
+        SELECT m.id, m.title, m.authors, m.media_type, m.rating, m.thoughts, m.url, m.created_at,
+               m.image_key
+        FROM media_fts
+        JOIN media m ON m.id = media_fts.rowid
+        WHERE media_fts MATCH ?
+        ORDER BY bm25(media_fts, 10.0, 5.0, 1.0)
+        LIMIT ?
+    ''', (query, limit)).fetchall()
+
+    return [dict(zip(CARD_COLUMNS, item)) for item in items]
+
+def find_similar(media_id, limit=SIMILAR_LIMIT):
+    """
+    The items most similar to `media_id`, best first, as dicts with a score.
+    Scores come from the postings of the item's strongest terms only, so a
+    lookup reads a few short postings lists rather than every vector.
+    """
+    conn = get_connection()
+    total = conn.execute('SELECT items FROM vector_count WHERE id = 1').fetchone()[0]
+    terms = conn.execute('''
+        SELECT t.term, t.weight, d.df
+        FROM media_terms t
+        JOIN term_df d ON d.term = t.term
+        WHERE t.media_id = ?
+    ''', (media_id,)).fetchall()
+
+    weights = query_weights(terms, total)
+    if not weights:
+        return []
+
+    values = ', '.join(['(?, ?)'] * len(weights))
+    params = [value for pair in weights for value in pair] + [media_id, limit]
+    items = conn.execute(f'''
+        WITH query (term, weight) AS (VALUES {values}),
+        scores AS (
+            SELECT p.media_id, SUM(q.weight * p.weight) AS dot
+            FROM query q
+            JOIN media_terms p ON p.term = q.term
+            WHERE p.media_id != ?
+            GROUP BY p.media_id
+        )
+        SELECT m.id, m.title, m.authors, m.media_type, m.rating, m.thoughts, m.url, m.created_at,
+               m.image_key, s.dot / v.norm AS score
+        FROM scores s
+        JOIN media_vectors v ON v.media_id = s.media_id
+        JOIN media m ON m.id = s.media_id
+        ORDER BY score DESC
+        LIMIT ?
+    ''', params).fetchall()
+
+    return [dict(zip(CARD_COLUMNS + ('score',), item)) for item in items]
+
+def get_media_item(item_id):
+    """Return one media item as a dict, or None."""
+    conn = get_connection()
+    item = conn.execute('''
+        SELECT id, title, authors, media_type, rating, thoughts, url, created_at, image_key
+        FROM media
+        WHERE id = ?
+    ''', (item_id,)).fetchone()
+    return dict(zip(CARD_COLUMNS, item)) if item else None
+
+def get_stats():
+    """
+    Summary statistics read from media_stats, so the cost depends on the
+    number of (type, rating, month) buckets rather than the number of items.
+    Returns dict: total, by_type, rating_histogram (unrated under 0) and
+    by_month (month, rated count, average rating).
+    """
+    conn = get_connection()
+
+    by_type = conn.execute('''
+        SELECT media_type, SUM(item_count) FROM media_stats
+        GROUP BY media_type ORDER BY 2 DESC
+    ''').fetchall()
+    histogram = dict(conn.execute('''
+        SELECT rating, SUM(item_count) FROM media_stats GROUP BY rating
+    ''').fetchall())
+    by_month = conn.execute('''
+        SELECT month, SUM(item_count), 1.0 * SUM(rating * item_count) / SUM(item_count)
+        FROM media_stats
+        WHERE rating > 0
+        GROUP BY month ORDER BY month DESC
+    ''').fetchall()
+
+    return {
+        'total': sum(count for _, count in by_type),
+        'by_type': by_type,
+        'rating_histogram': [(rating, histogram.get(rating, 0)) for rating in range(0, 11)],
+        'by_month': by_month
+    }
+
+def build_facet_query(media_types, min_rating=None, since=None, until=None):
+    """
+    SQL and parameters counting items per media type under the rating and
+    date filters. Without a date filter the counts come from media_stats;
+    otherwise from a covering index, never from the table itself.
+    """
+    placeholders = ', '.join('?' * len(media_types))
+    if since is None and until is None:
+        rating = 'AND rating >= ?' if min_rating is not None else ''
+        sql = f'''
+            SELECT media_type, SUM(item_count) FROM media_stats
+            WHERE media_type IN ({placeholders}) {rating}
+            GROUP BY media_type
+        '''
+        return sql, list(media_types) + ([min_rating] if min_rating is not None else [])
+
+    clauses, params = _filter_clauses(min_rating=min_rating, since=since, until=until)
+    sql = f'''
+        SELECT media_type, COUNT(*) FROM media
+        WHERE media_type IN ({placeholders}) AND {' AND '.join(clauses)}
+        GROUP BY media_type
+    '''
+    return sql, list(media_types) + params
+
+def get_facet_counts(media_types, min_rating=None, since=None, until=None):
+    """Return dict: media type -> number of items matching the other filters (0 when none)."""
+    conn = get_connection()
+    counts = dict(conn.execute(*build_facet_query(media_types, min_rating, since, until)).fetchall())
+    return {media_type: counts.get(media_type, 0) for media_type in media_types}
+
+JOB_COLUMNS = ('id', 'url', 'status', 'title', 'media_type', 'error', 'created_at', 'updated_at')
+
+def create_extraction_job(url):
+    """
+    Queue a title extraction job for a normalized URL, unless one is already
+    queued or running for it.
+    Returns tuple: (job_id, created)
+    """
+    conn = get_connection()
+    now = time.time()
+
+    with conn:
+        cursor = conn.execute('''
+            INSERT OR IGNORE INTO extraction_jobs (url, status, created_at, updated_at)
+            VALUES (?, 'queued', ?, ?)
+        ''', (url, now, now))
+        if cursor.rowcount:
+            return cursor.lastrowid, True
+
+        job = conn.execute('''
+            SELECT id FROM extraction_jobs
+            WHERE url = ? AND status IN ('queued', 'running')
+        ''', (url,)).fetchone()
+
+    return job[0], False
+
+def get_extraction_job(job_id):
+    """Retrieve an extraction job as a dict, or None."""
+    conn = get_connection()
+    job = conn.execute('''
+        SELECT id, url, status, title, media_type, error, created_at, updated_at
+        FROM extraction_jobs WHERE id = ?
+    ''', (job_id,)).fetchone()
+    return dict(zip(JOB_COLUMNS, job)) if job else None
+
+def claim_extraction_job(job_id):
+    """Move a queued job to running. Returns False if another worker got it first."""
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute('''
+            UPDATE extraction_jobs SET status = 'running', updated_at = ?
+            WHERE id = ? AND status = 'queued'
+        ''', (time.time(), job_id))
+    return cursor.rowcount > 0
+
+def finish_extraction_job(job_id, title, media_type, success, error=None):
+    """Record the outcome of a running job."""
+    conn = get_connection()
+    with conn:
+        conn.execute('''
+            UPDATE extraction_jobs
+            SET status = ?, title = ?, media_type = ?, error = ?, updated_at = ?
+            WHERE id = ?
+        ''', ('done' if success else 'failed', title, media_type, error, time.time(), job_id))
+
+def recover_extraction_jobs():
+    """
+    Housekeeping at startup: requeue running jobs whose worker died, prune
+    old finished jobs and return [(job_id, url)] for everything queued.
+    """
+    conn = get_connection()
+    now = time.time()
+
+    with conn:
+        conn.execute('''
+            UPDATE extraction_jobs SET status = 'queued', updated_at = ?
+            WHERE status = 'running' AND updated_at < ?
+        ''', (now, now - JOB_STALE_AFTER))
+        conn.execute('''
+            DELETE FROM extraction_jobs
+            WHERE status IN ('done', 'failed') AND updated_at < ?
+        ''', (now - JOB_KEEP_FOR,))
+
+    return conn.execute('''
+        SELECT id, url FROM extraction_jobs WHERE status = 'queued' ORDER BY id
+    ''').fetchall()
+
+def get_thumbnail_key(image_url):
+    """The key of the thumbnails made from `image_url`, or None if it hasn't been fetched."""
+    conn = get_connection()
+    row = conn.execute('SELECT image_key FROM thumbnails WHERE image_url = ?', (image_url,)).fetchone()
+    return row[0] if row else None
+
+def record_thumbnail(image_url, image_key):
+    """
+    Remember that `image_url`'s thumbnails are stored under `image_key` and
+    show them on every item with that preview image.
+    """
+    conn = get_connection()
+    with conn:
+        conn.execute('''
+            INSERT INTO thumbnails (image_url, image_key, created_at) VALUES (?, ?, ?)
+            ON CONFLICT (image_url) DO UPDATE SET image_key = excluded.image_key
+        ''', (image_url, image_key, time.time()))
+        cursor = conn.execute('''
+            UPDATE media SET image_key = ?
+            WHERE image_url = ? AND image_key IS NOT ?
+        ''', (image_key, image_url, image_key))
+        if cursor.rowcount:
+            _bump_data_version(conn)
+
+def forget_thumbnail(image_key):
+    """Drop an evicted thumbnail: its items go back to showing no image."""
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute('''
+            UPDATE media SET image_key = NULL
+            WHERE image_url IN (SELECT image_url FROM thumbnails WHERE image_key = ?)
+              AND image_key = ?
+        ''', (image_key, image_key))
+        conn.execute('DELETE FROM thumbnails WHERE image_key = ?', (image_key,))
+        if cursor.rowcount:
+            _bump_data_version(conn)
 
 def delete_media_item(item_id):
     """Delete a media item by ID."""
-    conn = sqlite3.connect(DATABASE)
+    conn = get_connection()
+
+    with conn:
+        cursor = conn.execute('DELETE FROM media WHERE id = ?', (item_id,))
+        deleted = cursor.rowcount > 0
+        if deleted:
+            _unindex_media(conn, item_id)
+            _bump_data_version(conn)
+
+    return deleted
+
+SNAPSHOT_COLUMNS = ('id', 'kind', 'base_change_id', 'last_change_id', 'filename', 'rows',
+                    'sha256', 'created_at')
+SNAPSHOT_ROW_COLUMNS = MEDIA_COLUMNS + ('canonical_url', 'image_url', 'image_key')
+
+def get_last_change_id():
+    """The newest entry in the media change log (0 when it is empty and nothing was logged yet)."""
+    conn = get_connection()
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'media_changes'").fetchone()
+    return row[0] if row else 0
+
+def get_snapshots():
+    """Every recorded snapshot, oldest first."""
+    conn = get_connection()
+    rows = conn.execute('''
+        SELECT id, kind, base_change_id, last_change_id, filename, rows, sha256, created_at
+        FROM snapshots
+        ORDER BY id
+    ''').fetchall()
+    return [dict(zip(SNAPSHOT_COLUMNS, row)) for row in rows]
+
+def iter_snapshot_rows(since=None, upto=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yield the media rows a snapshot needs, as (media_id, row) where row is a
+    dict of SNAPSHOT_ROW_COLUMNS, or None when the item has been deleted.
+    With since=None that is every row; otherwise every item with a logged
+    change in (since, upto], in its current state. Borrows its own connection
+    from the pool.
+    """
+    conn = pool.acquire()
     cursor = conn.cursor()
-    
-    cursor.execute('DELETE FROM media WHERE id = ?', (item_id,))
-    conn.commit()
-    conn.close()
-    return cursor.rowcount > 0 
\ No newline at end of file
+    try:
+        if since is None:
+            cursor.execute('''
+                SELECT id, id, title, authors, media_type, rating, thoughts, url, created_at,
+                       canonical_url, image_url, image_key
+                FROM media
+                ORDER BY id
+            ''')
+        else:
+            cursor.execute('''
+                SELECT c.media_id, m.id, m.title, m.authors, m.media_type, m.rating, m.thoughts,
+                       m.url, m.created_at, m.canonical_url, m.image_url, m.image_key
+                FROM (SELECT DISTINCT media_id FROM media_changes
+                      WHERE change_id > ? AND change_id <= ?) AS c
+                LEFT JOIN media AS m ON m.id = c.media_id
+                ORDER BY c.media_id
+            ''', (since, upto))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row[0], dict(zip(SNAPSHOT_ROW_COLUMNS, row[1:])) if row[1] is not None else None
+    finally:
+        cursor.close()
+        pool.release(conn)
+
+def record_snapshot(kind, base_change_id, last_change_id, filename, rows, sha256):
+    """Record a written snapshot and prune the change log entries it covers. Returns its ID."""
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute('''
+            INSERT INTO snapshots (kind, base_change_id, last_change_id, filename, rows, sha256, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (kind, base_change_id, last_change_id, filename, rows, sha256, time.time()))
+        conn.execute('DELETE FROM media_changes WHERE change_id <= ?', (last_change_id,))
+    return cursor.lastrowid
+
+def apply_snapshot_rows(conn, changes):
+    """
+    Write snapshot entries into the database behind `conn` (a restore target):
+    (media_id, row) pairs are upserted, or deleted when row is None. Upserting
+    rather than INSERT OR REPLACE keeps the search and stats triggers in step.
+    Items with thumbnails get their image_url -> image_key mapping back too.
+    The similar-items vectors are left alone: rebuild them once the last
+    snapshot is in. Call inside a transaction.
+    """
+    for media_id, row in changes:
+        if row is None:
+            conn.execute('DELETE FROM media WHERE id = ?', (media_id,))
+        else:
+            # Snapshots written before preview images were kept carry neither column
+            row = dict({'image_url': None, 'image_key': None}, **row)
+            conn.execute('''
+                INSERT INTO media (id, title, authors, media_type, rating, thoughts, url, created_at,
+                                   canonical_url, image_url, image_key)
+                VALUES (:id, :title, :authors, :media_type, :rating, :thoughts, :url, :created_at,
+                        :canonical_url, :image_url, :image_key)
+                ON CONFLICT (id) DO UPDATE SET
+                    title = excluded.title, authors = excluded.authors,
+                    media_type = excluded.media_type, rating = excluded.rating,
+                    thoughts = excluded.thoughts, url = excluded.url,
+                    created_at = excluded.created_at, canonical_url = excluded.canonical_url,
+                    image_url = excluded.image_url, image_key = excluded.image_key
+            ''', row)
+            if row['image_url'] and row['image_key']:
+                conn.execute('''
+                    INSERT INTO thumbnails (image_url, image_key, created_at) VALUES (?, ?, ?)
+                    ON CONFLICT (image_url) DO UPDATE SET image_key = excluded.image_key
+                ''', (row['image_url'], row['image_key'], time.time()))
+    _bump_data_version(conn)
+
+def mark_restored(previous_version):
+    """
+    Move data_version past `previous_version` after the database has been
+    replaced, so caches and ETags from before the restore can't be reused.
+    """
+    conn = get_connection()
+    with conn:
+        conn.execute('UPDATE data_version SET version = MAX(version, ?) + 1, updated_at = ? WHERE id = 1',
+                     (previous_version, time.time()))
@@ -0,0 +1,25 @@
+"""
+gunicorn settings for serving the feed with several worker processes:
+
+    gunicorn                                # uses this file from the current directory
+    WEB_CONCURRENCY=8 BIND=0.0.0.0:8000 gunicorn
+
+Every worker builds its own app with create_app() and opens its own SQLite
+connections; WAL lets them all read while one of them writes.
+"""
+import multiprocessing
+import os
+
+wsgi_app = 'app:create_app()'
+bind = os.environ.get('BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# A few threads per worker, so a request waiting on the SQLite write lock
+# doesn't leave the whole worker idle
+threads = int(os.environ.get('WEB_THREADS', 4))
+timeout = 30
+accesslog = os.environ.get('ACCESS_LOG')
+
+def post_worker_init(worker):
+    """Each worker picks up extraction jobs left queued; claiming a job is atomic, so none runs twice."""
+    from jobs import extraction_queue
+    extraction_queue.resume()
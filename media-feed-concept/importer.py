@@ -0,0 +1,201 @@
+import csv
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+from database import add_media_items, find_existing_urls
+from thumbnails import thumbnail_queue
+from url_scraper import lookup_url, normalize_url, guess_media_type_from_url
+
+IMPORT_WORKERS = 16  # lookups in flight across all hosts
+PER_HOST_LIMIT = 2  # lookups in flight against any single host
+FETCH_TIMEOUT = 10  # seconds per request
+
+# CSV header names we understand, most specific first
+CSV_FIELDS = {
+    'url': ('url', 'link', 'href'),
+    'title': ('title', 'name'),
+    'authors': ('authors', 'author', 'by'),
+    'media_type': ('media_type', 'type'),
+    'rating': ('rating', 'score'),
+    'thoughts': ('thoughts', 'notes', 'note', 'review', 'description'),
+}
+
+class _BookmarkParser(HTMLParser):
+    """Collects (href, link text) pairs from a Netscape bookmark export."""
+
+    def __init__(self):
+        super().__init__()
+        self.links = []
+        self._href = None
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            self._href = dict(attrs).get('href')
+            self._text = []
+
+    def handle_data(self, data):
+        if self._href is not None:
+            self._text.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == 'a' and self._href is not None:
+            self.links.append((self._href, ''.join(self._text).strip()))
+            self._href = None
+
+def _entry(url, title=None, authors=None, media_type=None, rating=None, thoughts=None):
+    return {'url': url, 'title': title or None, 'authors': authors or None,
+            'media_type': media_type or None, 'rating': rating or None,
+            'thoughts': thoughts or None, 'image_url': None}
+
+def parse_import(text):
+    """
+    Parse an import file into entry dicts (url, title, authors, media_type,
+    rating, thoughts). Accepts a browser bookmark export, a CSV with a header
+    row naming at least a URL column, or plain text with one URL per line.
+    """
+    stripped = text.lstrip()
+    if stripped.startswith('<') or '<a ' in stripped[:4096].lower():
+        parser = _BookmarkParser()
+        parser.feed(text)
+        return [_entry(href, title=title) for href, title in parser.links
+                if href and href.lower().startswith(('http://', 'https://'))]
+
+    first_line = stripped.split('\n', 1)[0]
+    if ',' in first_line or '\t' in first_line:
+        delimiter = '\t' if '\t' in first_line else ','
+        reader = csv.DictReader(io.StringIO(stripped), delimiter=delimiter)
+        columns = {name.strip().lower(): name for name in reader.fieldnames or []}
+        fields = {}
+        for field, aliases in CSV_FIELDS.items():
+            fields[field] = next((columns[a] for a in aliases if a in columns), None)
+        if fields['url'] is not None:
+            entries = []
+            for row in reader:
+                values = {field: (row.get(column) or '').strip()
+                          for field, column in fields.items() if column is not None}
+                if values.get('url'):
+                    entries.append(_entry(**values))
+            return entries
+
+    return [_entry(line.strip()) for line in text.splitlines()
+            if line.strip() and not line.strip().startswith('#')]
+
+class HostLimiter:
+    """Caps how many requests run at once against each host."""
+
+    def __init__(self, limit=PER_HOST_LIMIT):
+        self.limit = limit
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url):
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.limit)
+            return self._semaphores[host]
+
+def interleave_by_host(entries):
+    """
+    Reorder entries round-robin across hosts, so that a long run of links to
+    one site does not park every worker on that host's limiter.
+    """
+    by_host = {}
+    for entry in entries:
+        by_host.setdefault(urlsplit(normalize_url(entry['url']) or '').netloc, []).append(entry)
+
+    queues = list(by_host.values())
+    ordered = []
+    for i in range(max((len(q) for q in queues), default=0)):
+        ordered.extend(q[i] for q in queues if i < len(q))
+    return ordered
+
+def drop_duplicates(entries):
+    """
+    Drop entries whose URL is already in the feed or appears earlier in the
+    same import, comparing normalized URLs. Returns tuple: (entries, duplicates)
+    where duplicates is how many were dropped.
+    """
+    seen = find_existing_urls(entry['url'] for entry in entries)
+    kept = []
+    duplicates = 0
+    for entry in entries:
+        url = normalize_url(entry['url'])
+        if url in seen:
+            duplicates += 1
+            continue
+        if url is not None:
+            seen.add(url)
+        kept.append(entry)
+    return kept, duplicates
+
+def resolve_titles(entries, workers=IMPORT_WORKERS, per_host=PER_HOST_LIMIT, timeout=FETCH_TIMEOUT):
+    """
+    Fill in missing titles and media types by looking the URLs up concurrently.
+    Entries that already have a title are not fetched. Returns the entries,
+    grouped round-robin by host.
+    """
+    limiter = HostLimiter(per_host)
+
+    def resolve(entry):
+        url = normalize_url(entry['url'])
+        if url is None:
+            return entry
+        if entry['title']:
+            entry['media_type'] = entry['media_type'] or guess_media_type_from_url(url)
+            return entry
+        with limiter(url):
+            result = lookup_url(url, timeout=timeout)
+        entry['title'] = result['title']
+        entry['media_type'] = entry['media_type'] or result['media_type']
+        entry['image_url'] = result['image_url']
+        return entry
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(resolve, interleave_by_host(entries)))
+
+def build_rows(entries, media_types, default_rating=None):
+    """
+    Turn resolved entries into rows for database.add_media_items, falling back
+    to the URL when no title was found and to the guessed type when the given
+    one is unknown. Ratings outside 1-10 become default_rating.
+    """
+    rows = []
+    for entry in entries:
+        url = normalize_url(entry['url'])
+        if url is None:
+            continue
+
+        media_type = (entry['media_type'] or '').lower()
+        if media_type not in media_types:
+            media_type = guess_media_type_from_url(url)
+
+        try:
+            rating = int(entry['rating'])
+            if rating < 1 or rating > 10:
+                raise ValueError()
+        except (ValueError, TypeError):
+            rating = default_rating
+
+        rows.append((entry['title'] or url, entry['authors'], media_type, rating,
+                     entry['thoughts'], url, entry['image_url']))
+    return rows
+
+def import_links(text, media_types, default_rating=None, **resolve_options):
+    """
+    Parse, resolve and insert an import file in one transaction, skipping
+    links that are already in the feed (they are not fetched either), then
+    queue thumbnails for the preview images the lookups found.
+    Returns tuple: (new media IDs, number of duplicates skipped).
+    """
+    entries, duplicates = drop_duplicates(parse_import(text))
+    entries = resolve_titles(entries, **resolve_options)
+    rows = build_rows(entries, media_types, default_rating)
+    ids = add_media_items(rows)
+    for row in rows:
+        thumbnail_queue.submit(row[6])
+    return ids, duplicates
@@ -0,0 +1,79 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from database import (create_extraction_job, get_extraction_job, claim_extraction_job,
+                      finish_extraction_job, recover_extraction_jobs, release_connection)
+from thumbnails import thumbnail_queue
+from url_scraper import cached_lookup, lookup_url, normalize_url
+
+JOB_WORKERS = int(os.environ.get('EXTRACTION_WORKERS', 4))
+
+logger = logging.getLogger(__name__)
+
+class ExtractionQueue:
+    """
+    Runs title extraction in a background thread pool so requests never wait
+    on a slow site. Jobs live in the extraction_jobs table: they survive a
+    restart (see resume) and any process can report on any job. A page's
+    preview image is handed on to the thumbnail queue.
+    """
+
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='extract')
+            return self._executor
+
+    def submit(self, url):
+        """
+        Start extracting a URL's title. Returns the job dict; a URL that
+        already has a queued or running job gets that job back. Cached
+        results come back as an already finished job with id None.
+        """
+        cached = cached_lookup(url)
+        if cached is not None:
+            thumbnail_queue.submit(cached['image_url'])
+            return {'id': None, 'url': normalize_url(url),
+                    'status': 'done' if cached['success'] else 'failed',
+                    'title': cached['title'], 'media_type': cached['media_type'], 'error': None}
+
+        key = normalize_url(url)
+        job_id, created = create_extraction_job(key)
+        if created:
+            self._pool().submit(self._run, job_id, key)
+        return get_extraction_job(job_id)
+
+    def resume(self):
+        """Pick up jobs left queued (or orphaned while running) by a previous process."""
+        for job_id, url in recover_extraction_jobs():
+            self._pool().submit(self._run, job_id, url)
+
+    def _run(self, job_id, url):
+        if not claim_extraction_job(job_id):
+            return
+        try:
+            result = lookup_url(url)
+            finish_extraction_job(job_id, result['title'], result['media_type'], result['success'])
+            thumbnail_queue.submit(result['image_url'])
+        except Exception as e:
+            logger.exception('Extraction job %s for %s failed', job_id, url)
+            finish_extraction_job(job_id, None, None, False, error=str(e))
+        finally:
+            release_connection()
+
+    def shutdown(self, wait=True):
+        """Stop the worker threads (queued jobs stay in the table for resume)."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+extraction_queue = ExtractionQueue()
@@ -0,0 +1,177 @@
+import os
+import threading
+import time
+
+# Requests slower than this many milliseconds are logged with their breakdown
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 500))
+
+# Upper bounds in seconds, from sub-millisecond SQL up to multi-second fetches
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """A monotonically increasing count, one per combination of label values."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield f'{self.name}{_format_labels(self.labels, label_values)} {_format_number(value)}'
+
+class Histogram:
+    """
+    Counts observations into cumulative buckets, Prometheus style, keeping a
+    running sum and count for each combination of label values.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def add(self, value, *label_values):
+        """
+        Add `value` to the running sum without counting a new observation:
+        more time belonging to one already observed.
+        """
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = sorted((key, (list(counts), total, count))
+                            for key, (counts, total, count) in self._series.items())
+        for label_values, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, label_values, [('le', _format_number(bound))])
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labels, label_values, [('le', '+Inf')])
+            yield f'{self.name}_bucket{labels} {count}'
+            labels = _format_labels(self.labels, label_values)
+            yield f'{self.name}_sum{labels} {_format_number(total)}'
+            yield f'{self.name}_count{labels} {count}'
+
+def render():
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Time spent handling requests, by route.',
+    labels=('method', 'route', 'status'))
+SLOW_REQUESTS = Counter(
+    'http_slow_requests_total', 'Requests that took longer than SLOW_REQUEST_MS.',
+    labels=('method', 'route'))
+SQL_DURATION = Histogram(
+    'sqlite_statement_duration_seconds', 'Time spent executing and fetching SQL statements.',
+    labels=('statement',))
+RENDER_DURATION = Histogram(
+    'template_render_duration_seconds', 'Time spent rendering Jinja templates.',
+    labels=('template',))
+FETCH_DURATION = Histogram(
+    'scraper_fetch_duration_seconds', 'Time spent fetching pages to extract titles.',
+    labels=('outcome',))
+
+# Per-thread tallies of where the current request's time went. The app
+# serves each request on a single thread, so these add up to one request.
+_request = threading.local()
+
+def start_request():
+    """Reset this thread's tallies at the start of a request."""
+    _request.start = time.perf_counter()
+    _request.tally = {'sql': 0.0, 'sql_statements': 0, 'render': 0.0, 'fetch': 0.0}
+
+def request_elapsed():
+    """Seconds since start_request, or None outside a request."""
+    start = getattr(_request, 'start', None)
+    return None if start is None else time.perf_counter() - start
+
+def request_tally():
+    """Where this request's time went so far: sql, sql_statements, render and fetch."""
+    return dict(getattr(_request, 'tally', None) or {})
+
+def end_request():
+    """Stop attributing time on this thread to a request."""
+    _request.start = _request.tally = None
+
+def _add(key, seconds, count_key=None):
+    tally = getattr(_request, 'tally', None)
+    if tally is not None:
+        tally[key] += seconds
+        if count_key:
+            tally[count_key] += 1
+
+def observe_sql(statement, seconds):
+    """Time spent executing a statement; each call counts one statement."""
+    SQL_DURATION.observe(seconds, statement)
+    _add('sql', seconds, 'sql_statements')
+
+def observe_sql_fetch(statement, seconds):
+    """Time spent fetching rows of a statement already counted by observe_sql."""
+    SQL_DURATION.add(seconds, statement)
+    _add('sql', seconds)
+
+def observe_render(template, seconds):
+    RENDER_DURATION.observe(seconds, template)
+    _add('render', seconds)
+
+def observe_fetch(outcome, seconds):
+    FETCH_DURATION.observe(seconds, outcome)
+    _add('fetch', seconds)
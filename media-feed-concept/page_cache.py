@@ -0,0 +1,43 @@
+import threading
+from collections import OrderedDict
+
+PAGE_CACHE_SIZE = 64  # rendered pages kept per process
+
+class PageCache:
+    """
+    Rendered pages keyed by the data version they were rendered from plus a
+    page key (e.g. the feed cursor). Moving to a new version drops every
+    page rendered from an older one; within a version the least recently
+    used page goes first.
+    """
+
+    def __init__(self, max_entries=PAGE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.version = None
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version, key):
+        """Return the cached body for `key` at `version`, or None."""
+        with self._lock:
+            if version == self.version and key in self._pages:
+                self._pages.move_to_end(key)
+                self.hits += 1
+                return self._pages[key]
+            self.misses += 1
+            return None
+
+    def set(self, version, key, body):
+        """Store a body rendered from `version`; stale versions are ignored."""
+        with self._lock:
+            if self.version is None or version > self.version:
+                self.version = version
+                self._pages.clear()
+            elif version < self.version:
+                return
+            self._pages[key] = body
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
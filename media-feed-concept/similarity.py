@@ -0,0 +1,72 @@
+import math
+import re
+import zlib
+from collections import Counter
+
+HASH_BITS = 22  # terms are hashed into 2**22 buckets, so no vocabulary table is needed
+FIELD_WEIGHTS = {'title': 3.0, 'authors': 2.0, 'thoughts': 1.0}
+QUERY_TERMS = 32  # only an item's strongest terms are used to look up its neighbours
+DF_CAP_RATIO = 0.01  # terms in more than 1% of items carry no signal and have huge postings lists
+DF_CAP_MIN = 50  # ...but never cap below this, so small feeds still find neighbours
+SIMILAR_LIMIT = 6
+
+_WORD = re.compile(r'\w{2,}')
+
+STOPWORDS = frozenset('''
+    about after again all also and any are because been before being but by can could did
+    does doing down during each few for from further had has have having her here hers him
+    his how into its itself just more most much not now off once only other our ours out
+    over own same she should some such than that the their theirs them then there these they
+    this those through too under until very was were what when where which while who whom
+    why will with would you your yours
+'''.split())
+
+def tokenize(text):
+    """Lowercased words of two or more characters, without stopwords."""
+    return [word for word in _WORD.findall((text or '').lower()) if word not in STOPWORDS]
+
+def term_id(token):
+    """Stable hashed term id for a token."""
+    return zlib.crc32(token.encode('utf-8')) & ((1 << HASH_BITS) - 1)
+
+def vectorize(title, authors, thoughts):
+    """
+    Sparse term vector {term_id: weight} for an item. Each field's term
+    counts are log-scaled and weighted (title counts most); author names
+    hash into their own space, so sharing an author is its own signal.
+    """
+    counts = Counter()
+    for field, text in (('title', title), ('thoughts', thoughts)):
+        for token, count in Counter(tokenize(text)).items():
+            counts[term_id(token)] += FIELD_WEIGHTS[field] * (1.0 + math.log(count))
+    for token in set(tokenize(authors)):
+        counts[term_id('by:' + token)] += FIELD_WEIGHTS['authors']
+    return dict(counts)
+
+def vector_norm(vector):
+    return math.sqrt(sum(weight * weight for weight in vector.values()))
+
+def idf(df, total):
+    """Smoothed inverse document frequency."""
+    return math.log((1 + total) / (1 + df)) + 1.0
+
+def df_cap(total):
+    """Terms appearing in more items than this are ignored at query time."""
+    return max(DF_CAP_MIN, int(total * DF_CAP_RATIO))
+
+def query_weights(terms, total):
+    """
+    Turn an item's [(term, weight, df)] into the [(term, query weight)] used
+    to score neighbours: IDF is applied here, at query time, so vectors never
+    need rewriting as document frequencies drift. Only the QUERY_TERMS
+    strongest terms under the df cap are kept.
+    """
+    cap = df_cap(total)
+    weighted = []
+    for term, weight, df in terms:
+        if df <= cap:
+            term_idf = idf(df, total)
+            # One idf for the query side and one for the stored document side
+            weighted.append((term, weight * term_idf * term_idf))
+    weighted.sort(key=lambda pair: pair[1], reverse=True)
+    return weighted[:QUERY_TERMS]
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh database in a temporary directory, as this thread's connection."""
+    monkeypatch.setattr(database, 'DATABASE', str(tmp_path / 'test.db'))
+    database.init_db()
+    yield database.get_connection()
+    database.close_connection()
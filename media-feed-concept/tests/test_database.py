@@ -0,0 +1,33 @@
+import database
+
+
+def rows(count):
+    for i in range(count):
+        yield (f'Item {i}', f'Author {i % 7}', 'books' if i % 2 else 'articles', i % 10 + 1,
+               f'Thoughts about item {i}', f'https://example.com/{i}')
+
+def summary_tables(conn):
+    return {
+        'stats': sorted(conn.execute('SELECT * FROM media_stats')),
+        'changes': conn.execute('SELECT COUNT(*) FROM media_changes').fetchone()[0],
+        'fts': conn.execute("SELECT COUNT(*) FROM media_fts WHERE media_fts MATCH 'thoughts'").fetchone()[0],
+    }
+
+def test_small_batch_keeps_the_triggers(db):
+    version = db.execute('PRAGMA schema_version').fetchone()[0]
+    ids = database.add_media_items(rows(database.BULK_INSERT_MIN_ROWS - 1))
+    assert len(ids) == database.BULK_INSERT_MIN_ROWS - 1
+    assert db.execute('PRAGMA schema_version').fetchone()[0] == version
+    assert summary_tables(db)['changes'] == len(ids)
+
+def test_bulk_batch_matches_per_row_triggers(db):
+    size = database.BULK_INSERT_MIN_ROWS
+    ids = database.add_media_items(rows(size * 3), chunk_size=size)
+    assert ids == list(range(1, len(ids) + 1))
+    triggers = db.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall()
+    assert set(database.BULK_INSERT_TRIGGERS) <= {name for name, in triggers}
+
+    bulk = summary_tables(db)
+    database.rebuild_stats()
+    assert bulk == summary_tables(db)
+    assert bulk['changes'] == bulk['fts'] == len(ids)
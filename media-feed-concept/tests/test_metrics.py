@@ -0,0 +1,55 @@
+import re
+
+import database
+import metrics
+
+
+def statement_samples(label):
+    """The (count, sum) of the SQL duration histogram for one statement label."""
+    text = metrics.render()
+    labels = re.escape(f'{{statement="{label}"}}')
+    count = re.search(rf'^sqlite_statement_duration_seconds_count{labels} (\S+)$', text, re.M)
+    total = re.search(rf'^sqlite_statement_duration_seconds_sum{labels} (\S+)$', text, re.M)
+    return (int(count.group(1)), float(total.group(1))) if count else (0, 0.0)
+
+def test_paged_select_counts_as_one_statement(db):
+    database.add_media_items((f'Item {i}', 'Someone', 'books', 5, 'Thoughts', None) for i in range(25))
+    before_count, before_sum = statement_samples('SELECT media')
+
+    metrics.start_request()
+    try:
+        cursor = db.execute('SELECT id FROM media ORDER BY id')
+        rows = []
+        while True:
+            batch = cursor.fetchmany(10)
+            if not batch:
+                break
+            rows.extend(batch)
+        tally = metrics.request_tally()
+    finally:
+        metrics.end_request()
+
+    count, total = statement_samples('SELECT media')
+    assert len(rows) == 25
+    assert tally['sql_statements'] == 1
+    assert tally['sql'] > 0
+    assert count - before_count == 1
+    assert total > before_sum
+
+def test_feed_page_counts_as_one_statement(db):
+    database.add_media_items((f'Item {i}', 'Someone', 'books', 5, 'Thoughts', None) for i in range(45))
+
+    metrics.start_request()
+    try:
+        items, next_cursor = database.get_media_page(limit=30)
+        tally = metrics.request_tally()
+    finally:
+        metrics.end_request()
+
+    assert len(items) == 30 and next_cursor is not None
+    assert tally['sql_statements'] == 1
+
+def test_fetch_time_adds_to_sum_without_counting():
+    metrics.SQL_DURATION.observe(0.002, 'TEST metrics')
+    metrics.SQL_DURATION.add(0.003, 'TEST metrics')
+    assert statement_samples('TEST metrics') == (1, 0.005)
@@ -0,0 +1,50 @@
+import itertools
+import random
+
+import pytest
+
+import database
+from app import MEDIA_TYPES
+
+SEED_ROWS = 2000  # Enough for ANALYZE to give the planner realistic statistics
+FILTER_VALUES = {
+    'media_type': [None, 'books'],
+    'min_rating': [None, 7],
+    'since': [None, '2024-01-01'],
+    'until': [None, '2024-06-30'],
+}
+FILTERS = [{name: value for name, value in zip(FILTER_VALUES, values) if value is not None}
+           for values in itertools.product(*FILTER_VALUES.values())]
+
+
+@pytest.fixture
+def seeded(db):
+    rng = random.Random(42)
+    with db:
+        db.executemany('''
+            INSERT INTO media (title, authors, media_type, rating, thoughts, url, created_at)
+            VALUES (?, 'Someone', ?, ?, '', NULL, datetime('2023-01-01', ? || ' minutes'))
+        ''', [(f'Item {i}', rng.choice(MEDIA_TYPES), rng.choice([None] + list(range(1, 11))),
+               rng.randrange(2 * 365 * 24 * 60)) for i in range(SEED_ROWS)])
+        db.execute('ANALYZE')
+    database.rebuild_stats()
+    return db
+
+def plan(conn, sql, params):
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+@pytest.mark.parametrize('after', [None, ('2024-03-01 00:00:00', 10**9)], ids=['first', 'after'])
+@pytest.mark.parametrize('filters', FILTERS, ids=lambda filters: '-'.join(filters) or 'unfiltered')
+def test_page_walks_an_index_in_feed_order(seeded, filters, after):
+    details = plan(seeded, *database.build_page_query(after, **filters))
+    index = 'idx_media_type_created_at' if 'media_type' in filters else 'idx_media_created_at'
+    assert any(f'USING INDEX {index}' in detail for detail in details), details
+    assert not any('TEMP B-TREE' in detail for detail in details), details
+
+@pytest.mark.parametrize('filters', [filters for filters in FILTERS if 'media_type' not in filters],
+                         ids=lambda filters: '-'.join(filters) or 'unfiltered')
+def test_facets_never_read_the_media_table(seeded, filters):
+    details = plan(seeded, *database.build_facet_query(MEDIA_TYPES, **filters))
+    steps = [detail for detail in details if detail.startswith(('SCAN', 'SEARCH'))]
+    assert steps, details
+    assert all('media_stats' in step or 'COVERING INDEX' in step for step in steps), details
@@ -0,0 +1,247 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database import get_thumbnail_key, record_thumbnail, forget_thumbnail, release_connection
+from url_scraper import get_session
+
+THUMBNAIL_DIR = os.path.abspath(os.environ.get('THUMBNAIL_DIR', 'thumbnails'))
+# Disk budget for every variant of every thumbnail; the least recently served go first
+THUMBNAIL_CACHE_BYTES = int(os.environ.get('THUMBNAIL_CACHE_MB', 200)) * 1024 * 1024
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_WIDTHS = (400, 800)  # a feed card's width at 1x and 2x
+THUMBNAIL_ASPECT = 1.91  # og:image's own 1200x630 shape, so most images need no cropping
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+MAX_IMAGE_BYTES = 10 * 1024 * 1024  # bigger downloads are abandoned
+MAX_IMAGE_PIXELS = 40 * 1000 * 1000  # refuse to decode anything larger (decompression bombs)
+FETCH_TIMEOUT = 10
+TOUCH_INTERVAL = 60 * 60  # a served thumbnail's last-used time is refreshed at most hourly
+EVICT_TO = 0.9  # eviction frees space down to this share of the budget
+
+_NAME = re.compile(r'^([0-9a-f]{32})-(\d+)\.(webp|jpg)$')
+
+logger = logging.getLogger(__name__)
+
+def thumbnail_height(width):
+    return round(width / THUMBNAIL_ASPECT)
+
+def thumbnail_name(key, width, ext):
+    return f'{key}-{width}.{ext}'
+
+def _path(name):
+    return os.path.join(THUMBNAIL_DIR, name[:2], name)
+
+def _variant_names(key):
+    return [thumbnail_name(key, width, ext) for width in THUMBNAIL_WIDTHS for ext in THUMBNAIL_FORMATS]
+
+def thumbnail_file(name):
+    """
+    Path of a stored thumbnail variant, or None when `name` isn't one (or has
+    been evicted). Serving it counts as a use for LRU eviction.
+    """
+    match = _NAME.match(name)
+    if not match or int(match.group(2)) not in THUMBNAIL_WIDTHS:
+        return None
+    path = _path(name)
+    try:
+        # The file's mtime is its last-used time
+        if os.stat(path).st_mtime < time.time() - TOUCH_INTERVAL:
+            os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+def make_thumbnails(data):
+    """
+    Resize image bytes into every variant: each width in THUMBNAIL_WIDTHS,
+    center-cropped to THUMBNAIL_ASPECT, in each of THUMBNAIL_FORMATS.
+    Returns dict: file extension -> {width: encoded bytes}. Raises ValueError
+    for images that are too large or can't be decoded.
+    """
+    # Only this background work needs Pillow, so it isn't loaded until then
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.width * image.height > MAX_IMAGE_PIXELS:
+                raise ValueError(f'image is {image.width}x{image.height}')
+            largest = max(THUMBNAIL_WIDTHS)
+            # JPEGs can be decoded straight at a fraction of their size; ask for
+            # a square so an EXIF rotation can't leave too few pixels
+            image.draft('RGB', (largest, largest))
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ('RGBA', 'LA', 'P'):
+                # Flatten transparency onto white rather than black
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, 'white')
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            else:
+                image = image.convert('RGB')
+
+            # Crop and scale once to the largest width, then scale that down
+            resized = {}
+            source = image
+            for width in sorted(THUMBNAIL_WIDTHS, reverse=True):
+                source = ImageOps.fit(source, (width, thumbnail_height(width)), Image.LANCZOS)
+                resized[width] = source
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f'not a usable image: {e}') from e
+
+    variants = {}
+    for ext, (image_format, options) in THUMBNAIL_FORMATS.items():
+        variants[ext] = {}
+        for width, image in resized.items():
+            buffer = io.BytesIO()
+            image.save(buffer, image_format, **options)
+            variants[ext][width] = buffer.getvalue()
+    return variants
+
+def _has_variants(key):
+    return all(os.path.exists(_path(name)) for name in _variant_names(key))
+
+def store_image(data):
+    """
+    Make and store the thumbnails for image bytes under their content hash,
+    so the same picture behind different URLs is only stored once.
+    Returns the key.
+    """
+    key = hashlib.sha256(data).hexdigest()[:32]
+    if _has_variants(key):
+        return key
+
+    os.makedirs(os.path.join(THUMBNAIL_DIR, key[:2]), exist_ok=True)
+    for ext, widths in make_thumbnails(data).items():
+        for width, encoded in widths.items():
+            path = _path(thumbnail_name(key, width, ext))
+            with open(path + '.partial', 'wb') as f:
+                f.write(encoded)
+            os.replace(path + '.partial', path)
+
+    evict()
+    return key
+
+_evict_lock = threading.Lock()
+
+def evict(limit=None):
+    """
+    If the stored thumbnails take more than `limit` bytes (default
+    THUMBNAIL_CACHE_BYTES), delete the least recently used until they fit
+    in EVICT_TO of it. Returns the evicted keys.
+    """
+    limit = THUMBNAIL_CACHE_BYTES if limit is None else limit
+    with _evict_lock:
+        keys = {}  # key -> [bytes, last used, paths]
+        for directory, _, filenames in os.walk(THUMBNAIL_DIR):
+            for filename in filenames:
+                match = _NAME.match(filename)
+                if not match:
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entry = keys.setdefault(match.group(1), [0, 0.0, []])
+                entry[0] += stat.st_size
+                entry[1] = max(entry[1], stat.st_mtime)
+                entry[2].append(path)
+
+        total = sum(entry[0] for entry in keys.values())
+        if total <= limit:
+            return []
+
+        evicted = []
+        for key, (size, _, paths) in sorted(keys.items(), key=lambda item: item[1][1]):
+            if total <= limit * EVICT_TO:
+                break
+            forget_thumbnail(key)
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            evicted.append(key)
+        return evicted
+
+def _download(image_url):
+    """The image's bytes, or None if it isn't an image or is larger than MAX_IMAGE_BYTES."""
+    with get_session().get(image_url, timeout=FETCH_TIMEOUT, stream=True) as response:
+        response.raise_for_status()
+        if not response.headers.get('Content-Type', '').lower().startswith('image/'):
+            return None
+        length = response.headers.get('Content-Length', '')
+        if length.isdigit() and int(length) > MAX_IMAGE_BYTES:
+            return None
+        data = bytearray()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            data += chunk
+            if len(data) > MAX_IMAGE_BYTES:
+                return None
+        return bytes(data)
+
+def fetch_thumbnail(image_url):
+    """
+    Make sure `image_url` has thumbnails: reuse stored ones, otherwise
+    download the image once and store them. Returns the key, or None.
+    """
+    key = get_thumbnail_key(image_url)
+    if key is None or not _has_variants(key):
+        data = _download(image_url)
+        if data is None:
+            return None
+        key = store_image(data)
+    record_thumbnail(image_url, key)
+    return key
+
+class ThumbnailQueue:
+    """
+    Fetches preview images in a small background thread pool, so neither
+    title extraction nor adding an item waits on a third-party image host.
+    A URL already being fetched by this process isn't queued again.
+    """
+
+    def __init__(self, workers=THUMBNAIL_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def submit(self, image_url):
+        if not image_url:
+            return
+        with self._lock:
+            if image_url in self._pending:
+                return
+            self._pending.add(image_url)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='thumbnail')
+            self._executor.submit(self._run, image_url)
+
+    def _run(self, image_url):
+        try:
+            fetch_thumbnail(image_url)
+        except Exception:
+            logger.exception('Fetching thumbnail %s failed', image_url)
+        finally:
+            release_connection()
+            with self._lock:
+                self._pending.discard(image_url)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+thumbnail_queue = ThumbnailQueue()
@@ -0,0 +1,126 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_DATABASE = 'url_cache.db'
+CACHE_TTL = 7 * 24 * 60 * 60  # successful lookups are reused for a week
+FAILURE_TTL = 15 * 60  # failed lookups are retried after 15 minutes
+MEMORY_SIZE = 1024  # entries kept in the in-memory LRU
+
+class URLCache:
+    """
+    Two-level cache of URL lookups: an in-memory LRU in front of a small
+    SQLite table, so results survive restarts and are shared by processes.
+    Entries are dicts with title, media_type, success, image_url and fetched_at.
+    """
+
+    def __init__(self, path=CACHE_DATABASE, ttl=CACHE_TTL, failure_ttl=FAILURE_TTL,
+                 memory_size=MEMORY_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0}
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS url_cache (
+                        url TEXT PRIMARY KEY,
+                        title TEXT,
+                        media_type TEXT,
+                        success INTEGER NOT NULL,
+                        fetched_at REAL NOT NULL,
+                        image_url TEXT
+                    )
+                ''')
+                columns = {row[1] for row in conn.execute('PRAGMA table_info(url_cache)')}
+                if 'image_url' not in columns:
+                    conn.execute('ALTER TABLE url_cache ADD COLUMN image_url TEXT')
+            self._local.conn = conn
+        return conn
+
+    def _expired(self, entry, now):
+        ttl = self.ttl if entry['success'] else self.failure_ttl
+        return entry['fetched_at'] + ttl < now
+
+    def _remember(self, url, entry):
+        with self._lock:
+            self._memory[url] = entry
+            self._memory.move_to_end(url)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def get(self, url):
+        """Return the cached entry for a normalized URL, or None if missing or stale."""
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(url)
+            if entry is not None:
+                if not self._expired(entry, now):
+                    self._memory.move_to_end(url)
+                    self._counters['memory_hits'] += 1
+                    return entry
+                del self._memory[url]
+
+        row = self._connection().execute(
+            'SELECT title, media_type, success, fetched_at, image_url FROM url_cache WHERE url = ?', (url,)
+        ).fetchone()
+        if row is not None:
+            entry = {'title': row[0], 'media_type': row[1], 'success': bool(row[2]),
+                     'fetched_at': row[3], 'image_url': row[4]}
+            if not self._expired(entry, now):
+                self._remember(url, entry)
+                self._count('disk_hits')
+                return entry
+
+        self._count('misses')
+        return None
+
+    def set(self, url, title, media_type, success, image_url=None):
+        """Store the outcome of a lookup and return the new entry."""
+        entry = {'title': title, 'media_type': media_type, 'success': bool(success),
+                 'fetched_at': time.time(), 'image_url': image_url}
+
+        conn = self._connection()
+        with conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO url_cache (url, title, media_type, success, fetched_at, image_url)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (url, title, media_type, int(entry['success']), entry['fetched_at'], image_url))
+
+        self._remember(url, entry)
+        self._count('stores')
+        return entry
+
+    def clear(self):
+        """Drop every cached entry, in memory and on disk."""
+        with self._lock:
+            self._memory.clear()
+        conn = self._connection()
+        with conn:
+            conn.execute('DELETE FROM url_cache')
+
+    def stats(self):
+        """Hit/miss counters since startup plus the current memory footprint."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
@@ -1,88 +1,308 @@
 import requests
-from bs4 import BeautifulSoup
-from newspaper import Article
+from requests.adapters import HTTPAdapter
+from html.parser import HTMLParser
+import codecs
 import logging
+import os
+import re
+import threading
+import time
+from urllib.parse import urljoin
+
+from media_rules import get_classifier
+from metrics import observe_fetch
+from url_cache import URLCache
+from urls import normalize_url
 
 # Set up logging to suppress verbose newspaper3k output
 logging.getLogger('newspaper').setLevel(logging.WARNING)
 logging.getLogger('urllib3').setLevel(logging.WARNING)
 
-def extract_title_from_url(url):
+# Shared cache of lookups, keyed by normalized URL
+title_cache = URLCache()
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+CHUNK_SIZE = 8 * 1024
+HEAD_BYTE_LIMIT = 64 * 1024  # give up on finding </head> after this much
+BODY_BYTE_LIMIT = 2 * 1024 * 1024  # most we read for the fallback parsers
+DRAIN_LIMIT = 64 * 1024  # finish reading up to this much after the head to keep the connection
+META_CHARSET_BYTES = 1024  # HTML requires a <meta> charset to be declared this early
+IMAGE_KEYS = ('og:image', 'og:image:url', 'og:image:secure_url', 'twitter:image', 'twitter:image:src')
+
+# <meta charset="..."> or <meta http-equiv="Content-Type" content="text/html; charset=...">
+_META_CHARSET = re.compile(rb'<meta[^>]*?charset\s*=\s*["\']?\s*([\w.:-]+)', re.IGNORECASE)
+
+# Shared HTTP session: keep-alive connections pooled per host
+POOL_CONNECTIONS = int(os.environ.get('SCRAPER_POOL_CONNECTIONS', 32))  # hosts with a pool
+POOL_MAXSIZE = int(os.environ.get('SCRAPER_POOL_MAXSIZE', 8))  # idle connections kept per host
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    Return the process-wide requests session, creating it on first use.
+    Connection pools are thread-safe, so every thread shares this one session.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+def configure_session(pool_connections=None, pool_maxsize=None):
+    """Change the pool sizes; the current session is closed and rebuilt on next use."""
+    global _session, POOL_CONNECTIONS, POOL_MAXSIZE
+    with _session_lock:
+        POOL_CONNECTIONS = pool_connections or POOL_CONNECTIONS
+        POOL_MAXSIZE = pool_maxsize or POOL_MAXSIZE
+        if _session is not None:
+            _session.close()
+            _session = None
+
+def session_stats():
+    """
+    Connection reuse per pooled host: requests sent, connection objects the
+    pool had to create, and requests served by an already pooled connection.
+    """
+    with _session_lock:
+        session = _session
+    hosts = {}
+    if session is not None:
+        for prefix in ('http://', 'https://'):
+            pools = session.get_adapter(prefix).poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                host = f'{pool.scheme}://{pool.host}:{pool.port}'
+                hosts[host] = {'requests': pool.num_requests,
+                               'connections': pool.num_connections,
+                               'reused': max(pool.num_requests - pool.num_connections, 0)}
+    totals = {field: sum(h[field] for h in hosts.values())
+              for field in ('requests', 'connections', 'reused')}
+    return dict(totals, hosts=hosts,
+                pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+
+def cached_lookup(url):
+    """Return lookup_url's result for a URL if it is cached, else None. Never fetches."""
+    key = normalize_url(url)
+    entry = title_cache.get(key) if key else None
+    return dict(entry, cached=True) if entry is not None else None
+
+def lookup_url(url, timeout=10):
+    """
+    Cached title, media type and preview image lookup for a URL.
+    Returns dict: title, media_type, success, image_url, fetched_at and cached
+    (True on a cache hit).
+    """
+    key = normalize_url(url)
+    if key is None:
+        return {'title': None, 'media_type': None, 'success': False, 'image_url': None,
+                'fetched_at': None, 'cached': False}
+
+    entry = cached_lookup(key)
+    if entry is not None:
+        return entry
+
+    title, success, image_url = extract_page_info(key, timeout=timeout)
+    entry = title_cache.set(key, title, guess_media_type_from_url(key), success, image_url)
+    return dict(entry, cached=False)
+
+class HeadTitleParser(HTMLParser):
+    """
+    Picks og:title, twitter:title and <title> out of an HTML document's head,
+    along with its og:image or twitter:image preview picture.
+    Feed it chunks as they arrive and stop once `done` is set.
     """
-    Extract title from URL using newspaper3k with BeautifulSoup fallback.
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.titles = {}
+        self.images = {}
+        self.done = False
+        self._in_title = False
+        self._title_text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'title':
+            self._in_title = True
+        elif tag == 'meta':
+            attrs = dict(attrs)
+            key = (attrs.get('property') or attrs.get('name') or '').lower()
+            content = (attrs.get('content') or '').strip()
+            if key in ('og:title', 'twitter:title') and content:
+                self.titles.setdefault(key, content)
+            elif key in IMAGE_KEYS and content:
+                self.images.setdefault(key, content)
+        elif tag == 'body':
+            self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == 'title' and self._in_title:
+            self._in_title = False
+            title = ''.join(self._title_text).strip()
+            if title:
+                self.titles.setdefault('title', ' '.join(title.split()))
+        elif tag == 'head':
+            self.done = True
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._title_text.append(data)
+
+    def best_title(self):
+        """og:title is usually the cleanest (no site-name suffix), then twitter:title, then <title>."""
+        for key in ('og:title', 'twitter:title', 'title'):
+            if key in self.titles:
+                return self.titles[key]
+        return None
+
+    def best_image(self, base_url):
+        """The preview image as an absolute http(s) URL (relative ones resolved against base_url), or None."""
+        for key in IMAGE_KEYS:
+            if key in self.images:
+                image_url = urljoin(base_url, self.images[key])
+                if image_url.lower().startswith(('http://', 'https://')):
+                    return image_url
+        return None
+
+def extract_title_from_url(url, timeout=10):
+    """
+    Extract title from URL with a single request: stream the page and stop at
+    </head> (or HEAD_BYTE_LIMIT). Only when the head has no usable title, keep
+    reading the same response and hand it to newspaper3k, then BeautifulSoup.
     Returns tuple: (title, success)
     """
+    title, success, _ = extract_page_info(url, timeout)
+    return title, success
+
+def extract_page_info(url, timeout=10):
+    """
+    Like extract_title_from_url, but also returns the page's og:image (or
+    twitter:image) URL when its head has one.
+    Returns tuple: (title, success, image_url)
+    """
+    start = time.perf_counter()
+    title, success, image_url = _extract_page_info(url, timeout)
+    observe_fetch('ok' if success else 'failed', time.perf_counter() - start)
+    return title, success, image_url
+
+def page_encoding(response, start):
+    """
+    The charset to decode a page with: the Content-Type header's if it
+    names one, else the <meta> charset declared at the `start` of the page,
+    else UTF-8. (requests assumes ISO-8859-1 for any text/html response
+    without a charset, which garbles most pages.)
+    """
+    if 'charset' in response.headers.get('Content-Type', '').lower() and response.encoding:
+        return response.encoding
+    match = _META_CHARSET.search(start[:META_CHARSET_BYTES])
+    if match:
+        try:
+            return codecs.lookup(match.group(1).decode('ascii')).name
+        except LookupError:
+            pass
+    return 'utf-8'
+
+def _extract_page_info(url, timeout):
     if not url or not url.strip():
-        return None, False
+        return None, False, None
     
     url = url.strip()
-    if not url.startswith(('http://', 'https://')):
+    if not url.lower().startswith(('http://', 'https://')):
         url = 'https://' + url
     
-    # First try newspaper3k
+    # Fast path: read just the head
+    try:
+        response = get_session().get(url, timeout=timeout, stream=True)
+    except Exception as e:
+        print(f"Fetching {url} failed: {e}")
+        return None, False, None
+
+    with response:
+        try:
+            response.raise_for_status()
+            content_type = response.headers.get('Content-Type', 'text/html')
+            if 'html' not in content_type and 'xml' not in content_type:
+                return None, False, None
+
+            encoding = None
+            parser = HeadTitleParser()
+            chunks = response.iter_content(chunk_size=CHUNK_SIZE)
+            html = []
+            received = 0
+            for chunk in chunks:
+                if encoding is None:
+                    encoding = page_encoding(response, chunk)
+                    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+                html.append(chunk)
+                received += len(chunk)
+                parser.feed(decoder.decode(chunk))
+                if parser.done or received >= HEAD_BYTE_LIMIT:
+                    break
+
+            title = parser.best_title()
+            image_url = parser.best_image(response.url)
+            if title:
+                # Closing a half-read response drops the connection; if only a
+                # little is left, read it so the connection goes back to the pool
+                length = response.headers.get('Content-Length', '')
+                if length.isdigit() and int(length) - received <= DRAIN_LIMIT:
+                    for chunk in chunks:
+                        pass
+                return title, True, image_url
+
+            # Slow path: the title must come from the body, so finish the download
+            for chunk in chunks:
+                html.append(chunk)
+                received += len(chunk)
+                if received >= BODY_BYTE_LIMIT:
+                    break
+            html = b''.join(html)
+            html = html.decode(encoding or page_encoding(response, html), errors='replace')
+        except Exception as e:
+            print(f"Reading {url} failed: {e}")
+            return None, False, None
+
+    # The fallback parsers are imported on first use: newspaper3k and the lxml
+    # it pulls in would otherwise slow every worker's startup and sit in its
+    # memory, though most titles come from the head
+    from newspaper import Article
+    from bs4 import BeautifulSoup
+
+    # newspaper3k parses the page we already have instead of opening its own connection
     try:
         article = Article(url)
-        article.download()
+        article.download(input_html=html)
         article.parse()
         
         if article.title and article.title.strip():
-            return article.title.strip(), True
+            return article.title.strip(), True, image_url
     except Exception as e:
         print(f"Newspaper3k failed: {e}")
     
-    # Fallback to BeautifulSoup
+    # Last resort: BeautifulSoup for a first <h1>
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Try different title selectors
-        title_selectors = [
-            'title',
-            'meta[property="og:title"]',
-            'meta[name="twitter:title"]',
-            'h1'
-        ]
-        
-        for selector in title_selectors:
-            if selector == 'title':
-                title_tag = soup.find('title')
-                if title_tag and title_tag.get_text().strip():
-                    return title_tag.get_text().strip(), True
-            elif selector.startswith('meta'):
-                meta_tag = soup.select_one(selector)
-                if meta_tag and meta_tag.get('content', '').strip():
-                    return meta_tag.get('content').strip(), True
-            else:  # h1
-                h1_tag = soup.find('h1')
-                if h1_tag and h1_tag.get_text().strip():
-                    return h1_tag.get_text().strip(), True
-                    
+        soup = BeautifulSoup(html, 'html.parser')
+        h1_tag = soup.find('h1')
+        if h1_tag and h1_tag.get_text().strip():
+            return h1_tag.get_text().strip(), True, image_url
     except Exception as e:
         print(f"BeautifulSoup fallback failed: {e}")
     
-    return None, False
+    return None, False, image_url
 
 def guess_media_type_from_url(url):
     """
-    Guess media type based on URL patterns.
+    Guess media type from the URL's host and path using the rule table in
+    media_rules.json (see media_rules.MediaClassifier).
     """
-    if not url:
-        return None
-    
-    url = url.lower()
-    
-    if 'twitter.com' in url or 'x.com' in url:
-        return 'tweets'
-    elif any(domain in url for domain in ['spotify.com', 'apple.com/podcasts', 'overcast.fm', 'pocketcasts.com']):
-        return 'podcasts'
-    elif any(domain in url for domain in ['goodreads.com', 'amazon.com/dp', 'books.google.com']):
-        return 'books'
-    elif any(domain in url for domain in ['medium.com', 'substack.com', 'blog.', '/blog/', 'article']):
-        return 'articles'
-    else:
-        return 'websites' 
\ No newline at end of file
+    return get_classifier().classify(url)
@@ -0,0 +1,42 @@
+from urllib.parse import urlsplit, urlunsplit
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = frozenset(('fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'igshid',
+                             'mc_cid', 'mc_eid', '_ga', '_hsenc', '_hsmi'))
+TRACKING_PREFIXES = ('utm_',)
+
+def _is_tracking(param):
+    name = param.partition('=')[0].lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+def normalize_url(url):
+    """
+    Canonical form of a URL, so that trivially different spellings of one link
+    compare equal: default to https, lowercase scheme and host, drop default
+    ports, fragments, tracking parameters (utm_*, fbclid, ...) and a trailing
+    slash. The remaining query string is kept byte for byte.
+    Returns None for empty input.
+    """
+    if not url or not url.strip():
+        return None
+
+    url = url.strip()
+    if not url.lower().startswith(('http://', 'https://')):
+        url = 'https://' + url
+
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and port != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{port}'
+
+    path = parts.path.rstrip('/') or '/'
+    query = '&'.join(param for param in parts.query.split('&') if param and not _is_tracking(param))
+
+    return urlunsplit((scheme, host, path, query, ''))